@@ -0,0 +1,107 @@
+"""
+Cold-start benchmark for the Streamlit entry points.
+
+Each app is measured in a fresh interpreter:
+
+- import: time to run the script's own top-level import statements
+- first render: time for one full script run of the default page with
+  streamlit's AppTest (imports already done, so this is the page itself)
+- heavy: which optional heavy modules are loaded after that first render
+
+Usage:
+    python bench_startup.py                   # every app in this directory
+    python bench_startup.py ecomm12.py --runs 5
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = (
+    "gspread", "google.oauth2.service_account", "sklearn", "smtplib",
+    "pymongo", "pyarrow", "numpy",
+)
+
+# runs inside the child interpreter: argv[1] is the app path
+_CHILD = r"""
+import ast, json, sys, time
+path = sys.argv[1]
+heavy = json.loads(sys.argv[2])
+with open(path, encoding="utf-8") as f:
+    tree = ast.parse(f.read(), path)
+imports = ast.Module([n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))], [])
+t0 = time.perf_counter()
+exec(compile(imports, path, "exec"), {"__name__": "__bench__"})
+t1 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(path, default_timeout=120)
+t2 = time.perf_counter()
+at.run()
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "render_ms": (t3 - t2) * 1000,
+    "exceptions": len(at.exception),
+    "heavy": [m for m in heavy if m in sys.modules],
+}))
+"""
+
+
+def entry_points(root="."):
+    apps = []
+    for path in sorted(glob.glob(os.path.join(root, "ecomm*.py")) + glob.glob(os.path.join(root, "onlineshop*.py"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                ast.parse(f.read(), path)
+        except SyntaxError:
+            continue  # design notes saved with a .py name, not apps
+        apps.append(path)
+    return apps
+
+
+def measure(path, runs=3):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _CHILD, path, json.dumps(HEAVY_MODULES)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(path)),
+        )
+        if out.returncode != 0:
+            return {"error": (out.stderr.strip().splitlines() or ["failed"])[-1]}
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "import_ms": statistics.median(s["import_ms"] for s in samples),
+        "render_ms": statistics.median(s["render_ms"] for s in samples),
+        "exceptions": samples[-1]["exceptions"],
+        "heavy": samples[-1]["heavy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("apps", nargs="*", help="app scripts (default: all entry points)")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per app (median is shown)")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for path in args.apps or entry_points(os.path.dirname(os.path.abspath(__file__))):
+        results[os.path.basename(path)] = measure(os.path.abspath(path), args.runs)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'app':<26}{'import ms':>10}{'render ms':>11}{'exc':>5}  heavy modules loaded")
+    for app, r in results.items():
+        if "error" in r:
+            print(f"{app:<26}  error: {r['error']}")
+            continue
+        print(f"{app:<26}{r['import_ms']:>10.0f}{r['render_ms']:>11.0f}{r['exceptions']:>5}  {', '.join(r['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
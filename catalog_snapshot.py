@@ -0,0 +1,293 @@
+import atexit
+import copy
+import hashlib
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+_NO_ROWS = np.empty(0, dtype=np.int64)
+
+
+def _intern(values, sort=False):
+    """
+    (codes, table) for a column of strings: each distinct string is stored
+    once in `table` and rows hold int32 codes into it. With `sort` the table
+    is sorted, so the codes also rank the rows.
+    """
+    codes, table = pd.factorize(pd.Series(values, dtype=object).fillna("").astype(str), sort=sort)
+    return codes.astype(np.int32), np.asarray(table, dtype=object)
+
+
+class CatalogSnapshot:
+    """
+    Read-only, column-oriented view of one catalog version.
+
+    Products are stored as NumPy columns: int64 ids, float64 prices and
+    int32 codes into interned string tables for categories, names and image
+    URLs. `row_of()` maps a product id to its row in O(1). Product dicts are
+    only materialized for the rows a page actually shows (`take()` and
+    `get()`).
+
+    Built once per catalog version:
+
+    - `categories` (sorted) and `facets`, the product count per category
+    - a posting list of row numbers per category
+    - one row permutation per sort order in SORT_KEYS
+
+    A filter plus sort request is then a boolean mask over the rows, applied
+    to a precomputed permutation (`order[mask[order]]`), so no request sorts
+    the catalog. Ties keep catalog order, as with Python's stable `sorted()`.
+    """
+
+    SORT_KEYS = ("price", "-price", "name", "-name")
+
+    def __init__(self, ids, names, prices, categories, images):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self._index_rows()
+        self.name_codes, self.names = _intern(names, sort=True)
+        self.category_codes, table = _intern(categories, sort=True)
+        self.categories = table.tolist()
+        self.image_codes, self.images = _intern(images)
+
+        # unparseable prices become NaN: they sort last and match no range
+        self.prices = pd.to_numeric(pd.Series(prices, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        finite = self.prices[np.isfinite(self.prices)]
+        self._int_prices = bool(np.all(finite == np.floor(finite)))
+        price_type = int if self._int_prices else float
+        self.price_range = (price_type(finite.min()), price_type(finite.max())) if len(finite) else (0, 0)
+
+        by_code = np.argsort(self.category_codes, kind="stable").astype(np.int32)
+        counts = np.bincount(self.category_codes, minlength=len(self.categories))
+        self.facets = dict(zip(self.categories, counts.tolist()))
+        self._postings = dict(zip(self.categories, np.split(by_code, np.cumsum(counts)[:-1])))
+
+        keys = {"price": self.prices, "-price": -self.prices, "name": self.name_codes, "-name": -self.name_codes}
+        self._orders = {k: np.argsort(v, kind="stable").astype(np.int32) for k, v in keys.items()}
+        self.version = self._fingerprint()
+
+    def _index_rows(self):
+        # Sheet ids are usually small and dense, so a flat id -> row array
+        # is both O(1) and far smaller than a dict; sparse ids use a dict.
+        # Duplicate ids resolve to their first row.
+        n = len(self.ids)
+        self._row_array = self._row_dict = None
+        if n and self.ids.min() >= 0 and self.ids.max() < 4 * n + 1024:
+            self._row_array = np.full(self.ids.max() + 1, -1, dtype=np.int32)
+            self._row_array[self.ids[::-1]] = np.arange(n - 1, -1, -1, dtype=np.int32)
+        else:
+            self._row_dict = {}
+            for row, product_id in enumerate(self.ids.tolist()):
+                self._row_dict.setdefault(product_id, row)
+
+    def row_of(self, product_id):
+        """
+        Row of `product_id`, or None if it is not in the catalog.
+        """
+        if self._row_dict is not None:
+            return self._row_dict.get(product_id)
+        if not 0 <= product_id < len(self._row_array):
+            return None
+        row = self._row_array[product_id]
+        return None if row < 0 else int(row)
+
+    def rows_of(self, ids):
+        """
+        Rows of the catalog products among `ids`, in `ids` order.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._row_dict is not None:
+            rows = np.fromiter((self._row_dict.get(i, -1) for i in ids.tolist()), dtype=np.int64, count=len(ids))
+        else:
+            known = (ids >= 0) & (ids < len(self._row_array))
+            rows = np.full(len(ids), -1, dtype=np.int64)
+            rows[known] = self._row_array[ids[known]]
+        return rows[rows >= 0]
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build from a DataFrame with id, name, price, category and img
+        columns (missing columns default to 0 / ""), without a per-row loop.
+        """
+        def column(name, default):
+            return df[name] if name in df.columns else pd.Series(default, index=df.index)
+
+        ids = pd.to_numeric(column("id", 0), errors="coerce").fillna(0)
+        return cls(ids, column("name", ""), column("price", 0), column("category", ""), column("img", ""))
+
+    @classmethod
+    def from_products(cls, products):
+        return cls.from_frame(pd.DataFrame(list(products), columns=["id", "name", "price", "category", "img"]))
+
+    def _fingerprint(self):
+        h = hashlib.blake2b(digest_size=16)
+        for column in (self.ids, self.prices, self.name_codes, self.category_codes, self.image_codes):
+            h.update(column.tobytes())
+        for table in (self.names, self.categories, self.images):
+            h.update("\0".join(table).encode())
+        return h.hexdigest()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def with_images(self, links):
+        """
+        Copy of the snapshot whose first products use the image URLs in
+        `links`, in row order.
+        """
+        links = list(links)[:len(self)]
+        images = self.images[self.image_codes]
+        images[:len(links)] = links
+        snap = copy.copy(self)
+        snap.image_codes, snap.images = _intern(images)
+        snap.version = snap._fingerprint()
+        return snap
+
+    def product(self, row):
+        price = self.prices[row]
+        return {
+            "id": self.ids[row].item(),
+            "name": self.names[self.name_codes[row]],
+            "price": int(price) if self._int_prices and np.isfinite(price) else price.item(),
+            "category": self.categories[self.category_codes[row]],
+            "img": self.images[self.image_codes[row]],
+        }
+
+    def get(self, product_id):
+        row = self.row_of(product_id)
+        return None if row is None else self.product(row)
+
+    def take(self, rows):
+        return [self.product(i) for i in rows]
+
+    def head(self, n):
+        return self.take(range(min(n, len(self))))
+
+    def select(self, categories=None, ids=None, sort=None, price_min=None, price_max=None):
+        """
+        Row numbers of the products in any of `categories` (all if empty),
+        priced within [price_min, price_max] when given and, when `ids` is
+        given, among those ids. Rows come in `sort` order (one of
+        SORT_KEYS), else in `ids` order, else in catalog order.
+        """
+        n = len(self.ids)
+        mask = None
+        if categories:
+            mask = np.zeros(n, dtype=bool)
+            for c in categories:
+                mask[self._postings.get(c, _NO_ROWS)] = True
+        if price_min is not None or price_max is not None:
+            in_range = np.isfinite(self.prices)
+            if price_min is not None:
+                in_range &= self.prices >= price_min
+            if price_max is not None:
+                in_range &= self.prices <= price_max
+            mask = in_range if mask is None else mask & in_range
+        if ids is not None:
+            rows = self.rows_of(ids)
+            if sort is None:
+                return rows[mask[rows]] if mask is not None else rows
+            hit = np.zeros(n, dtype=bool)
+            hit[rows] = True
+            mask = hit if mask is None else mask & hit
+        if sort is None:
+            return np.flatnonzero(mask) if mask is not None else np.arange(n)
+        order = self._orders[sort]
+        return order[mask[order]] if mask is not None else order
+
+
+class CatalogLoader:
+    """
+    One shared CatalogSnapshot for every session, reloaded only on change.
+
+    A background thread calls the cheap `version()` (a revision timestamp,
+    row count or checksum cell) every `interval` seconds and calls the
+    expensive `fetch()` only when it returns something new. The new
+    snapshot is swapped in whole, so a reader holding `get()`'s result
+    keeps a consistent catalog; if the fetched content turns out unchanged
+    the old snapshot (and everything keyed on its `version`) is kept.
+
+    Until the first fetch succeeds `fallback` is served. When `version()`
+    itself fails, the catalog is still re-fetched once it is `max_age`
+    seconds old, so a missing permission degrades to a plain TTL.
+    """
+
+    def __init__(self, fetch, version, fallback=None, interval=30.0, max_age=600.0):
+        self.fetch = fetch
+        self.version = version
+        self.interval = interval
+        self.max_age = max_age
+        self.snapshot = fallback
+        self.from_fallback = True
+        self.source_version = None
+        self.loaded_at = None
+        self.checks = 0
+        self.loads = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        try:
+            self.refresh()
+        except Exception as e:
+            self.last_error = repr(e)
+        self._thread = threading.Thread(target=self._run, name="catalog-loader", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def get(self):
+        return self.snapshot
+
+    def refresh(self, force=False):
+        """
+        Check the version signal and reload if it changed (or if `force`).
+        Returns True when a new snapshot was swapped in; raises whatever
+        `fetch()` raised.
+        """
+        with self._lock:
+            self.checks += 1
+            self.last_error = None
+            try:
+                version = self.version()
+            except Exception as e:
+                self.last_error = repr(e)
+                version = None
+                stale = self.loaded_at is None or time.monotonic() - self.loaded_at >= self.max_age
+                if not (force or stale):
+                    return False
+            else:
+                if not force and not self.from_fallback and version == self.source_version:
+                    return False
+            snap = self.fetch()
+            self.loads += 1
+            self.source_version = version
+            self.loaded_at = time.monotonic()
+            self.from_fallback = False
+            if self.snapshot is not None and snap.version == self.snapshot.version:
+                return False
+            self.snapshot = snap
+            return True
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.last_error = repr(e)
+
+    def stats(self):
+        snap = self.snapshot
+        return {
+            "products": 0 if snap is None else len(snap),
+            "version": None if snap is None else snap.version,
+            "source_version": self.source_version,
+            "from_fallback": self.from_fallback,
+            "checks": self.checks,
+            "loads": self.loads,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# How much sharing a session counts for each event type when items are ranked.
+ACTION_WEIGHTS = {"view": 1.0, "add_to_cart": 2.0, "order": 3.0}
+
+
+class ItemCooccurrence:
+    """
+    "Customers also viewed" neighbors from co-view, co-cart and co-purchase
+    counts.
+
+    Events are grouped into per-user sessions that end after `session_gap`
+    seconds without activity. Only closed sessions are counted: a user's
+    latest session stays open until a later event of theirs, or any event
+    `session_gap` after it, shows it is over. Per action, the counts are the
+    off-diagonal of B.T @ B for the binary session x item matrix B,
+    computed as a self-join of (session, item) pairs, and are added to the
+    running totals as sessions close.
+
+    Neighbor lists are ranked by the weighted cosine of the per-action
+    counts, pruned to `topk` per item and cached until the next update.
+    """
+
+    def __init__(self, session_gap=1800, topk=10, weights=ACTION_WEIGHTS):
+        self.session_gap = pd.Timedelta(seconds=session_gap)
+        self.topk = topk
+        self.weights = dict(weights)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._pairs = None
+            self._items = None
+            self._open = pd.DataFrame(columns=["user", "timestamp", "action", "product_name"])
+            self._latest = None
+            self._neighbors = None
+            self.sessions = 0
+
+    def apply(self, new_rows, reset=False):
+        if reset:
+            self.reset()
+        self.update(new_rows)
+
+    def update(self, events):
+        """
+        Add new events; count every session they show to be closed.
+        """
+        if events is None or events.empty:
+            return
+        events = events[events["action"].isin(list(self.weights))]
+        events = events[["user", "timestamp", "action", "product_name"]].dropna()
+        with self._lock:
+            if events.empty and self._open.empty:
+                return
+            df = pd.concat([self._open, events], ignore_index=True)
+            df["timestamp"] = pd.to_datetime(df["timestamp"])
+            df = df.sort_values(["user", "timestamp"], kind="stable")
+            latest = df["timestamp"].max()
+            self._latest = latest if self._latest is None else max(self._latest, latest)
+
+            new_user = df["user"].ne(df["user"].shift())
+            gap = df["timestamp"].diff() > self.session_gap
+            df["session"] = (new_user | gap).cumsum()
+            # a user's last session stays open unless it has gone quiet
+            last = df.groupby("user")["session"].transform("max")
+            ends = df.groupby("session")["timestamp"].transform("max")
+            is_open = (df["session"] == last) & (ends > self._latest - self.session_gap)
+            self._open = df.loc[is_open, ["user", "timestamp", "action", "product_name"]]
+            closed = df.loc[~is_open, ["session", "action", "product_name"]]
+            if not closed.empty:
+                self._count(closed)
+
+    def _count(self, closed):
+        # caller holds self._lock
+        items = closed.drop_duplicates()
+        pairs = items.merge(items, on=["session", "action"], suffixes=("", "_other"))
+        pairs = pairs[pairs["product_name"] != pairs["product_name_other"]]
+        pair_counts = pairs.groupby(["action", "product_name", "product_name_other"]).size()
+        item_counts = items.groupby(["action", "product_name"]).size()
+        if self._pairs is None:
+            self._pairs, self._items = pair_counts, item_counts
+        else:
+            self._pairs = self._pairs.add(pair_counts, fill_value=0)
+            self._items = self._items.add(item_counts, fill_value=0)
+        self.sessions += closed["session"].nunique()
+        self._neighbors = None
+
+    def _build_neighbors(self):
+        # caller holds self._lock
+        if self._pairs is None or self._pairs.empty:
+            return {}
+        pairs = self._pairs.rename("n").reset_index()
+        pairs.columns = ["action", "item", "other", "n"]
+        pairs = pairs.join(self._items.rename_axis(["action", "item"]).rename("n_item"), on=["action", "item"])
+        pairs = pairs.join(self._items.rename_axis(["action", "other"]).rename("n_other"), on=["action", "other"])
+        norm = np.sqrt(pairs["n_item"] * pairs["n_other"])
+        pairs["score"] = pairs["n"] / norm * pairs["action"].map(self.weights)
+        scores = pairs.groupby(["item", "other"])["score"].sum().reset_index()
+        top = (
+            scores.sort_values(["item", "score"], ascending=[True, False])
+            .groupby("item", sort=False)
+            .head(self.topk)
+        )
+        return {item: tuple(others) for item, others in top.groupby("item", sort=False)["other"]}
+
+    def neighbors(self, product, k=None):
+        """
+        Products most often sessioned together with `product`, best first.
+        """
+        with self._lock:
+            if self._neighbors is None:
+                self._neighbors = self._build_neighbors()
+            found = self._neighbors.get(product, ())
+        return list(found[:k] if k else found)
+
+    def counts(self, action="view"):
+        """
+        Pair counts for one action as a (product, other) -> sessions Series.
+        """
+        with self._lock:
+            if self._pairs is None or action not in self._pairs.index.get_level_values(0):
+                return pd.Series(dtype="float64")
+            return self._pairs.xs(action, level=0).copy()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": self.sessions,
+                "open_events": len(self._open),
+                "pairs": 0 if self._pairs is None else len(self._pairs),
+            }
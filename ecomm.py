@@ -169,19 +169,58 @@ def current_user():
 ```python
 import streamlit as st
 from db import get_session, Product
+from search_index import SearchIndex
 import pandas as pd
 
+PAGE_SIZE = 12
+
 if 'cart' not in st.session_state:
     st.session_state.cart = []
+if 'catalog_after' not in st.session_state:
+    st.session_state.catalog_after = [0]  # last product id before each visited page
+
+
+@st.cache_resource
+def get_search_index():
+    """
+    Prefix/BM25 index over product names and descriptions, built once per
+    process; admin.py adds new products to it.
+    """
+    db = get_session()
+    rows = db.query(Product.id, Product.name, Product.description)
+    return SearchIndex.build((pid, f"{name} {desc or ''}") for pid, name, desc in rows)
+
+
+def _next_page(last_id):
+    st.session_state.catalog_after.append(last_id)
+
+
+def _prev_page():
+    st.session_state.catalog_after.pop()
+
+
+def _first_page():
+    st.session_state.catalog_after = [0]
 
 
 def show_catalog():
     st.header("Products")
     db = get_session()
-    products = db.query(Product).all()
-    q = st.text_input("Search")
+    q = st.text_input("Search", on_change=_first_page)
+    after = st.session_state.catalog_after
     if q:
-        products = [p for p in products if q.lower() in (p.name + (p.description or '')).lower()]
+        # search results are ranked, so they page by offset into the id list
+        ids = get_search_index().search(q)
+        start = (len(after) - 1) * PAGE_SIZE
+        page_ids = ids[start:start + PAGE_SIZE]
+        found = {p.id: p for p in db.query(Product).filter(Product.id.in_(page_ids))} if page_ids else {}
+        products = [found[i] for i in page_ids if i in found]
+        has_next = len(ids) > start + PAGE_SIZE
+    else:
+        # keyset pagination: each page is one range scan on the primary key
+        products = db.query(Product).filter(Product.id > after[-1]).order_by(Product.id).limit(PAGE_SIZE + 1).all()
+        has_next = len(products) > PAGE_SIZE
+        products = products[:PAGE_SIZE]
     cols = st.columns(3)
     for i,p in enumerate(products):
         with cols[i%3]:
@@ -193,6 +232,9 @@ def show_catalog():
             if st.button("Add to cart", key=f"add_{p.id}"):
                 st.session_state.cart.append({'product_id':p.id,'name':p.name,'price':float(p.price),'qty':qty})
                 st.success(f"Added {p.name}")
+    prev_col, next_col = st.columns(2)
+    prev_col.button("← Previous", on_click=_prev_page, disabled=len(after) == 1)
+    next_col.button("Next →", on_click=_next_page, args=(products[-1].id if products else 0,), disabled=not has_next)
 
 
 def show_cart_page():
@@ -208,6 +250,12 @@ def show_cart_page():
 
 ---
 
+### search_index.py
+
+Use `search_index.py` from the repository root as is: catalog search looks products up in its inverted index instead of scanning every row.
+
+---
+
 ### payments.py (Stripe test-mode)
 
 ```python
@@ -304,6 +352,7 @@ def upload_image(file_obj, filename):
 import streamlit as st
 from db import get_session, Product
 from storage import upload_image
+from catalog import get_search_index
 
 
 def show_admin_dashboard():
@@ -332,6 +381,7 @@ def show_admin_dashboard():
                 img_url = upload_image(img_file, f"prod_{sku}_{img_file.name}")
             p = Product(sku=sku, name=name, description=desc, price=price, category=cat, stock=stock, image_url=img_url)
             db.add(p); db.commit()
+            get_search_index().add(p.id, f"{name} {desc or ''}")
             st.success('Added')
             st.experimental_rerun()
 ```
@@ -1,14 +1,12 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import datetime
 import pandas as pd
 import numpy as np
-import requests
 import json
 import os
-from email.mime.text import MIMEText
-import smtplib
+from geo import GeoCache, GeoEnricher, lookup_from_env
+from recommender import OnlineRecommender, model_from_arrays
+from model_registry import ModelRegistry, SharedModelCache
 
 st.set_page_config(page_title="E-Commerce App", layout="wide")
 
@@ -18,8 +16,6 @@ if "user" not in st.session_state:
     st.session_state.user = None
 if "client_ip_checked" not in st.session_state:
     st.session_state.client_ip_checked = False
-if "ml_model" not in st.session_state:
-    st.session_state.ml_model = None
 
 PRODUCTS = [
     {"id": 1, "name": "Laptop", "price": 55000, "category": "Computers",
@@ -67,6 +63,9 @@ def clean_df(df):
 
 
 def get_sheet():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds = Credentials.from_service_account_info(
         st.secrets["gcp_service_account"],
         scopes=["https://www.googleapis.com/auth/spreadsheets"]
@@ -112,83 +111,89 @@ def ensure_client_ip():
     st.components.v1.html(html, height=0)
     st.session_state.client_ip_checked = True
 
+@st.cache_resource
+def get_geo_cache():
+    """
+    IP -> geo answers shared by all sessions, so a returning visitor
+    never costs another ipapi.co round trip. Resolved from the offline
+    range file first when GEO_RANGES_CSV is set.
+    """
+    return GeoCache(
+        lookup=lookup_from_env(),
+        maxsize=int(os.environ.get("GEO_CACHE_SIZE", 10000)),
+        ttl=int(os.environ.get("GEO_CACHE_TTL", 86400)),
+        negative_ttl=int(os.environ.get("GEO_CACHE_NEGATIVE_TTL", 300)),
+    )
+
+@st.cache_resource
+def get_geo_enricher():
+    """
+    Background lookups into the geo cache, so a click never waits on
+    ipapi.co.
+    """
+    return GeoEnricher(get_geo_cache(), workers=4)
+
 def get_geo(ip):
-    try:
-        if not ip:
-            return {}
-        r = requests.get(f"https://ipapi.co/{ip}/json/", timeout=5)
-        if r.ok:
-            return r.json()
-    except:
-        pass
-    return {"ip": ip} if ip else {}
-
-def encode_texts(texts):
-    vocab = {}
-    encoded = []
-    for t in texts:
-        w = t.lower().split()
-        row = []
-        for word in w:
-            if word not in vocab:
-                vocab[word] = len(vocab)
-            row.append(vocab[word])
-        encoded.append(row)
-    return encoded, vocab
-
-def vectorize(encoded, size):
-    X = np.zeros((len(encoded), size))
-    for i, row in enumerate(encoded):
-        for idx in row:
-            X[i, idx] += 1
-    return X
+    # cached answer, or just the IP while the lookup runs in the background
+    return get_geo_enricher().resolve(ip)
+
+MODEL_DIR = os.environ.get("MODEL_REGISTRY_DIR", "models")
+
+@st.cache_resource
+def get_model_cache():
+    """
+    Published models loaded once per process and shared by all sessions.
+    """
+    return SharedModelCache(ModelRegistry(MODEL_DIR), decode={"lightweight": model_from_arrays})
+
+RECOMMENDER_DIR = os.environ.get("RECOMMENDER_DIR", "recommender_state")
+
+@st.cache_resource
+def get_recommender():
+    """
+    View model persisted under RECOMMENDER_DIR; it skips the rows it has
+    already been trained on, so retraining only touches new events.
+    """
+    return OnlineRecommender(
+        RECOMMENDER_DIR, dtype=os.environ.get("RECOMMENDER_DTYPE", "float64")
+    )
 
 def train_lightweight_ml():
+    shared = True
     try:
         rows = get_sheet().get_all_records()
     except:
         rows = st.session_state.get("_local_logs", [])
+        shared = False
 
     if not rows:
         return None
 
-    df = pd.DataFrame(rows)
-    df = df[df["action"] == "view"]
-    if df.empty:
-        return None
-
-    df["text"] = df["user"] + " " + df["product_name"]
-    enc, vocab = encode_texts(df["text"].tolist())
-    X = vectorize(enc, len(vocab))
-    labels = df["product_name"].astype("category")
-    y = labels.cat.codes
-    C = labels.cat.categories
+    # this session's own rows are trained apart from the persisted model
+    model = get_recommender() if shared else OnlineRecommender()
+    model.apply(pd.DataFrame(rows), reset=True)
+    model.train_pending()
 
-    if len(df) < 5:
+    if model.views_trained < 5:
         return None
-
-    W = np.random.randn(X.shape[1])
-    lr = 0.01
-
-    for _ in range(200):
-        y_pred = 1 / (1 + np.exp(-X.dot(W)))
-        grad = X.T.dot(y_pred - (y / y.max()))
-        W -= lr * grad
-
-    return (W, vocab, C)
+    if not shared:
+        # never published for other sessions
+        return model.snapshot()
+    # publish only when new rows were trained on; every session shares the result
+    return get_model_cache().get_or_train(
+        "lightweight", f"softmax-{model.rows_trained}", model.to_arrays
+    )
 
 def recommend(user, model):
     if not model:
         return [p["name"] for p in PRODUCTS[:3]]
-    W, vocab, classes = model
+    W, b, vocab, classes = model
     if not user:
         user = "guest"
-    words = user.lower().split()
-    vec = np.zeros(len(vocab))
-    for w in words:
-        if w in vocab:
-            vec[vocab[w]] += 1
-    score = vec.dot(W)
+    # words the model has never seen are dropped, as are columns added to
+    # the shared vocabulary after W was trained
+    vec = vocab.encode([user], grow=False).resize(W.shape[0])
+    score = vec.dot(W)[0] + b
     idx = np.argsort(-score)
     out = []
     for i in idx[:3]:
@@ -1,14 +1,23 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import datetime
 import pandas as pd
 import numpy as np
-import requests
 import json
 import os
-from email.mime.text import MIMEText
-import smtplib
+from event_writer import BufferedEventWriter
+from sheets import EVENT_HEADER, SheetCache
+from event_spool import EventSpool, SpoolReplayer
+from geo import GeoCache, GeoEnricher, lookup_from_env
+from event_store import EventStore, decode_events
+from rollups import EventRollup, count_by
+from cooccurrence import ItemCooccurrence
+from event_archive import EventArchive
+from exporter import EXPORT_FORMATS, export_bytes
+from recommender import OnlineRecommender, model_from_arrays
+from model_registry import ModelRegistry, SharedModelCache
+from recommendations import RecommendationTable, TableRefresher
+from search_index import SearchIndex
+from catalog_snapshot import CatalogSnapshot
 
 st.set_page_config(page_title="E-Commerce App", layout="wide")
 
@@ -18,8 +27,6 @@ if "user" not in st.session_state:
     st.session_state.user = None
 if "client_ip_checked" not in st.session_state:
     st.session_state.client_ip_checked = False
-if "ml_model" not in st.session_state:
-    st.session_state.ml_model = None
 
 PRODUCTS = [
     {"id": 1, "name": "Laptop", "price": 55000, "category": "Computers",
@@ -66,26 +73,145 @@ def clean_df(df):
 
 
 
-def get_sheet():
-    creds = Credentials.from_service_account_info(
+@st.cache_resource
+def get_sheet_cache():
+    """
+    One authorized gspread client and worksheet handle per process,
+    shared by every session instead of re-authorizing per event.
+    """
+    return SheetCache(
         st.secrets["gcp_service_account"],
-        scopes=["https://www.googleapis.com/auth/spreadsheets"]
+        st.secrets["sheets"]["sheet_id"],
     )
-    gc = gspread.authorize(creds)
-    sh = gc.open_by_key(st.secrets["sheets"]["sheet_id"])
+
+def get_sheet():
+    return get_sheet_cache().worksheet("views", header=EVENT_HEADER)
+
+SPOOL_PATH = os.environ.get("EVENT_SPOOL_PATH", "event_spool.db")
+
+@st.cache_resource
+def get_event_spool():
+    """
+    On-disk spool for rows the sheet rejected, shared by all sessions.
+    """
+    return EventSpool(SPOOL_PATH)
+
+@st.cache_resource
+def get_spool_replayer():
+    """
+    Background drain of the spool back into the sheet once it is reachable.
+    """
+    cache = get_sheet_cache()
+    return SpoolReplayer(
+        get_event_spool(),
+        lambda rows: cache.worksheet("views", header=EVENT_HEADER).append_rows(
+            rows, value_input_option="RAW"
+        ),
+    )
+
+@st.cache_resource
+def get_event_writer():
+    """
+    Process-wide writer shared by all sessions; batches that cannot be
+    written go to the on-disk spool.
+    """
+    cache = get_sheet_cache()
+    spool = get_event_spool()
+    get_spool_replayer()
+    return BufferedEventWriter(
+        lambda: cache.worksheet("views", header=EVENT_HEADER),
+        max_batch=50,
+        flush_interval=2.0,
+        on_error=lambda rows, exc: spool.append(rows),
+        on_write_error=cache.invalidate,
+    )
+
+@st.cache_resource
+def get_event_store():
+    """
+    Incrementally refreshed copy of the views sheet, shared by all sessions.
+    """
+    cache = get_sheet_cache()
+    # rows logged before their geo lookup finished are filled from the cache
+    return EventStore(lambda: cache.worksheet("views", header=EVENT_HEADER), geo=get_geo_cache().peek)
+
+@st.cache_resource
+def get_event_rollup():
+    """
+    Hourly count cube updated from each chunk the event store ingests.
+    """
+    rollup = EventRollup()
+    get_event_store().add_listener(rollup.apply)
+    return rollup
+
+@st.cache_resource
+def get_item_similarity():
+    """
+    Co-view/co-cart/co-purchase neighbors, updated as the event store
+    ingests rows and user sessions close.
+    """
+    similarity = ItemCooccurrence()
+    get_event_store().add_listener(similarity.apply)
+    return similarity
+
+ARCHIVE_DIR = os.environ.get("EVENT_ARCHIVE_DIR", "event_archive")
+# exports larger than this are refused instead of being held in memory
+EXPORT_MAX_BYTES = int(os.environ.get("EXPORT_MAX_MB", 200)) * 1024 * 1024
+
+@st.cache_resource
+def get_event_archive():
+    """
+    Parquet copy of the event store, partitioned by date and action, used
+    to read only the rows and columns a filtered query needs.
+    """
+    archive = EventArchive(ARCHIVE_DIR)
+    get_event_store().add_listener(archive.apply)
+    return archive
+
+def load_events():
+    """
+    (events, source): all logged events as a DataFrame and "store" when
+    they come from the event store, or "spool" when the sheet could not be
+    read and they are the on-disk spool plus this session's unsent rows.
+    """
     try:
-        return sh.worksheet("views")
-    except:
-        sh.add_worksheet("views", rows="2000", cols="20")
-        return sh.worksheet("views")
+        return get_event_store().refresh(), "store"
+    except Exception as e:
+        try:
+            get_sheet_cache().invalidate(e)
+        except Exception:
+            pass  # no sheet configured: nothing cached to drop
+        try:
+            rows = get_event_spool().rows()
+        except Exception:
+            rows = []
+        rows = list(rows) + st.session_state.get("_local_logs", [])
+        return decode_events(pd.DataFrame(rows, columns=EVENT_HEADER)), "spool"
 
-def log_event(user, pid, pname, action, extra=None):
+def log_event(user, pid, pname, action, extra=None, ip=None):
+    """
+    Record an event without waiting on the network. When `ip` is given the
+    cached geo fields are merged into `extra`; on a cache miss the row goes
+    out with just the IP and the event store fills in the geo later.
+    """
     t = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    row = [t, user, pid, pname, action, json.dumps(extra or {})]
+
+    def make_row(geo):
+        return [t, user, pid, pname, action, json.dumps({**geo, **(extra or {})})]
+
     try:
-        get_sheet().append_row(row)
-    except:
-        st.session_state.setdefault("_local_logs", []).append(row)
+        if ip:
+            get_geo_enricher().submit(ip, make_row)
+        else:
+            get_event_writer().submit(make_row({}))
+    except Exception:
+        # the writer could not be built (e.g. no sheet secrets): keep the
+        # row on the spool for the replayer, else in this session
+        row = make_row({})
+        try:
+            get_event_spool().append([row])
+        except Exception:
+            st.session_state.setdefault("_local_logs", []).append(row)
 
 def ensure_client_ip():
     if st.session_state.client_ip_checked:
@@ -112,83 +238,78 @@ def ensure_client_ip():
     st.components.v1.html(html, height=0)
     st.session_state.client_ip_checked = True
 
-def get_geo(ip):
-    try:
-        if not ip:
-            return {}
-        r = requests.get(f"https://ipapi.co/{ip}/json/", timeout=5)
-        if r.ok:
-            return r.json()
-    except:
-        pass
-    return {"ip": ip} if ip else {}
-
-def encode_texts(texts):
-    vocab = {}
-    encoded = []
-    for t in texts:
-        w = t.lower().split()
-        row = []
-        for word in w:
-            if word not in vocab:
-                vocab[word] = len(vocab)
-            row.append(vocab[word])
-        encoded.append(row)
-    return encoded, vocab
-
-def vectorize(encoded, size):
-    X = np.zeros((len(encoded), size))
-    for i, row in enumerate(encoded):
-        for idx in row:
-            X[i, idx] += 1
-    return X
+@st.cache_resource
+def get_geo_cache():
+    """
+    IP -> geo answers shared by all sessions, so a returning visitor
+    never costs another ipapi.co round trip. Resolved from the offline
+    range file first when GEO_RANGES_CSV is set.
+    """
+    return GeoCache(
+        lookup=lookup_from_env(),
+        maxsize=int(os.environ.get("GEO_CACHE_SIZE", 10000)),
+        ttl=int(os.environ.get("GEO_CACHE_TTL", 86400)),
+        negative_ttl=int(os.environ.get("GEO_CACHE_NEGATIVE_TTL", 300)),
+    )
 
-def train_lightweight_ml():
-    try:
-        rows = get_sheet().get_all_records()
-    except:
-        rows = st.session_state.get("_local_logs", [])
+def get_geo(ip):
+    return get_geo_cache().get(ip)
 
-    if not rows:
-        return None
+@st.cache_resource
+def get_geo_enricher():
+    """
+    Hands logged events to the event writer at once and resolves geo for
+    uncached IPs in the background, into the shared geo cache.
+    """
+    writer = get_event_writer()
+    return GeoEnricher(get_geo_cache(), writer.submit, workers=4)
 
-    df = pd.DataFrame(rows)
-    df = df[df["action"] == "view"]
-    if df.empty:
-        return None
+MODEL_DIR = os.environ.get("MODEL_REGISTRY_DIR", "models")
 
-    df["text"] = df["user"] + " " + df["product_name"]
-    enc, vocab = encode_texts(df["text"].tolist())
-    X = vectorize(enc, len(vocab))
-    labels = df["product_name"].astype("category")
-    y = labels.cat.codes
-    C = labels.cat.categories
+@st.cache_resource
+def get_model_cache():
+    """
+    Published models loaded once per process and shared by all sessions.
+    """
+    return SharedModelCache(ModelRegistry(MODEL_DIR), decode={"lightweight": model_from_arrays})
 
-    if len(df) < 5:
-        return None
+RECOMMENDER_DIR = os.environ.get("RECOMMENDER_DIR", "recommender_state")
 
-    W = np.random.randn(X.shape[1])
-    lr = 0.01
+@st.cache_resource
+def get_recommender():
+    """
+    View model persisted under RECOMMENDER_DIR. The event store hands it
+    each batch of new rows, so retraining only touches events added since
+    the last run.
+    """
+    model = OnlineRecommender(
+        RECOMMENDER_DIR, dtype=os.environ.get("RECOMMENDER_DTYPE", "float64")
+    )
+    get_event_store().add_listener(model.apply)
+    return model
 
-    for _ in range(200):
-        y_pred = 1 / (1 + np.exp(-X.dot(W)))
-        grad = X.T.dot(y_pred - (y / y.max()))
-        W -= lr * grad
+def train_lightweight_ml():
+    model = get_recommender()
+    load_events()  # refreshes the store, which buffers new views in the model
+    model.train_pending()
 
-    return (W, vocab, C)
+    if model.views_trained < 5:
+        return None
+    # publish only when new rows were trained on; every session shares the result
+    return get_model_cache().get_or_train(
+        "lightweight", f"softmax-{model.rows_trained}", model.to_arrays
+    )
 
 def recommend(user, model):
     if not model:
         return [p["name"] for p in PRODUCTS[:3]]
-    W, vocab, classes = model
+    W, b, vocab, classes = model
     if not user:
         user = "guest"
-    words = user.lower().split()
-    vec = np.zeros(len(vocab))
-    for w in words:
-        if w in vocab:
-            vec[vocab[w]] += 1
-    score = vec.dot(W)
+    # words the model has never seen are dropped, as are columns added to
+    # the shared vocabulary after W was trained
+    vec = vocab.encode([user], grow=False).resize(W.shape[0])
+    score = vec.dot(W)[0] + b
     idx = np.argsort(-score)
     out = []
     for i in idx[:3]:
@@ -196,6 +317,64 @@ def recommend(user, model):
             out.append(classes[i])
     return out if out else [p["name"] for p in PRODUCTS[:3]]
 
+RECS_PATH = os.environ.get("RECOMMENDATIONS_PATH", "recommendations.json")
+
+@st.cache_resource
+def get_recommendations():
+    """
+    Top products per user, rebuilt from the rollup cube in the background
+    every few minutes and saved to RECS_PATH between restarts.
+    """
+    store = get_event_store()
+    rollup = get_event_rollup()
+
+    def build():
+        store.refresh(force=True)
+        views = rollup.slice(actions=["view"])
+        return RecommendationTable.from_views(views, topn=5, count="count")
+
+    return TableRefresher(build, RECS_PATH, interval=600)
+
+def recommended_for(user, topn=3):
+    """
+    Precomputed picks for `user`; the most viewed products for unknown
+    users, or the first catalog items before anything was viewed or when
+    the event sheet cannot be reached.
+    """
+    try:
+        picks = get_recommendations().lookup(user, topn)
+    except Exception:
+        picks = None
+    return picks or [p["name"] for p in PRODUCTS[:topn]]
+
+@st.cache_resource
+def get_search_index():
+    """
+    Prefix/BM25 index over product names and categories, built once per
+    process.
+    """
+    return SearchIndex.build((p["id"], f"{p['name']} {p['category']}") for p in PRODUCTS)
+
+@st.cache_resource
+def get_catalog():
+    """
+    Columnar copy of PRODUCTS with its sort orders, category posting lists
+    and facet counts, computed once per process.
+    """
+    return CatalogSnapshot.from_products(PRODUCTS)
+
+# product page sort labels -> CatalogSnapshot sort keys
+SORT_OPTIONS = {
+    "Default": None,
+    "Price ↑": "price",
+    "Price ↓": "-price",
+    "Name A-Z": "name",
+    "Name Z-A": "-name",
+}
+
+# products per page on the product grid (a multiple of its 3 columns)
+PAGE_SIZE = 12
+
 def login():
     st.header("Login")
     u = st.text_input("Username")
@@ -212,7 +391,8 @@ def signup():
         st.session_state.user = u
         st.success("Account created")
 
-def add_to_cart(p, qty):
+def add_to_cart(product_id, qty):
+    p = get_catalog().get(product_id)
     for item in st.session_state.cart:
         if item["id"] == p["id"]:
             item["qty"] += qty
@@ -221,45 +401,53 @@ def add_to_cart(p, qty):
         st.session_state.cart.append({**p, "qty": qty})
     user = st.session_state.user or "guest"
     ip = st.session_state.get("client_ip")
-    geo = get_geo(ip) if ip else {}
-    log_event(user, p["id"], p["name"], "add_to_cart", geo)
+    log_event(user, p["id"], p["name"], "add_to_cart", ip=ip)
 
 def product_page():
     st.header("Products")
+    st.write("Recommended for you:", ", ".join(recommended_for(st.session_state.user or "guest")))
     search = st.text_input("Search")
-    categories = sorted(list({p["category"] for p in PRODUCTS}))
-    cat_sel = st.multiselect("Filter by Category", categories)
-    sort = st.selectbox("Sort by", ["Default","Price ↑","Price ↓","Name A-Z","Name Z-A"])
-
-    prods = PRODUCTS
-    if search:
-        q = search.lower()
-        prods = [p for p in prods if q in p["name"].lower()]
-    if cat_sel:
-        prods = [p for p in prods if p["category"] in cat_sel]
-    if sort == "Price ↑":
-        prods = sorted(prods, key=lambda x: x["price"])
-    elif sort == "Price ↓":
-        prods = sorted(prods, key=lambda x: -x["price"])
-    elif sort == "Name A-Z":
-        prods = sorted(prods, key=lambda x: x["name"])
-    elif sort == "Name Z-A":
-        prods = sorted(prods, key=lambda x: x["name"], reverse=True)
+    catalog = get_catalog()
+    cat_sel = st.multiselect("Filter by Category", catalog.categories,
+                             format_func=lambda c: f"{c} ({catalog.facets[c]})")
+    sort = st.selectbox("Sort by", list(SORT_OPTIONS))
+    lo, hi = catalog.price_range
+    price_sel = st.slider("Price range (₹)", lo, hi, (lo, hi)) if lo < hi else (lo, hi)
+    # the full range also keeps products without a usable price
+    price_min = price_sel[0] if price_sel[0] > lo else None
+    price_max = price_sel[1] if price_sel[1] < hi else None
+
+    ids = get_search_index().search(search) if search else None
+    rows = catalog.select(cat_sel, ids, SORT_OPTIONS[sort], price_min, price_max)
+    pages = max(1, -(-len(rows) // PAGE_SIZE))
+    # a new search, filter, price range or sort starts again from page 1
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                           key=f"page_{search}_{cat_sel}_{sort}_{price_sel}") if pages > 1 else 1
+    start = (page - 1) * PAGE_SIZE
+    if len(rows):
+        st.caption(f"Showing {start + 1}-{min(start + PAGE_SIZE, len(rows))} of {len(rows)} products")
+    # only the visible page gets widgets and images
+    prods = catalog.take(rows[start:start + PAGE_SIZE])
 
     cols = st.columns(3)
     for i, p in enumerate(prods):
         with cols[i % 3]:
             st.image(p["img"], use_column_width=True)
             st.write(p["name"], "₹", p["price"])
+            try:
+                also = get_item_similarity().neighbors(p["name"], 3)
+            except Exception:
+                also = []  # no event sheet: skip the co-view list
+            if also:
+                st.caption("Customers also viewed: " + ", ".join(also))
             qty = st.number_input(f"Qty_{p['id']}", min_value=1, value=1)
             if st.button(f"View {p['id']}"):
                 user = st.session_state.user or "guest"
                 ip = st.session_state.get("client_ip")
-                geo = get_geo(ip) if ip else {}
-                log_event(user, p["id"], p["name"], "view", geo)
+                log_event(user, p["id"], p["name"], "view", ip=ip)
                 st.success("Logged view")
             if st.button(f"Add {p['id']}"):
-                add_to_cart(p, int(qty))
+                add_to_cart(p["id"], int(qty))
                 st.success("Added")
 
 def show_cart():
@@ -282,35 +470,49 @@ def checkout():
     if st.button("Place Order"):
         user = st.session_state.user or "guest"
         ip = st.session_state.get("client_ip")
-        geo = get_geo(ip) if ip else {}
         for item in st.session_state.cart:
-            log_event(user, item["id"], item["name"], "order", geo)
+            log_event(user, item["id"], item["name"], "order", ip=ip)
         st.success("Order Placed")
         st.session_state.cart = []
 
+def show_stats(stats):
+    """
+    st.json(stats()) for an Admin block; components that need the event
+    sheet fail to build without its secrets, which is shown instead.
+    """
+    try:
+        st.json(stats())
+    except Exception as e:
+        st.info(f"Sheet not configured: {e}")
+
 def admin_panel():
     st.header("Admin")
     st.write("Total Products:", len(PRODUCTS))
+    st.subheader("Event writer")
+    show_stats(lambda: get_event_writer().stats())
+    try:
+        replayer = get_spool_replayer()
+    except Exception:
+        st.write("Spooled events awaiting replay:", get_event_spool().count())
+    else:
+        st.write("Spooled events awaiting replay:", replayer.spool.count())
+        if replayer.last_error:
+            st.write("Last replay error:", replayer.last_error)
+    st.subheader("Geo cache")
+    st.json(get_geo_cache().stats())
+    show_stats(lambda: get_geo_enricher().stats())
+    st.subheader("Search index")
+    st.json(get_search_index().stats())
+    st.subheader("Recommendations")
+    show_stats(lambda: get_recommendations().stats())
+    show_stats(lambda: get_item_similarity().stats())
 
 
 def analytics():
     st.header("Analytics Dashboard")
 
-    # --- Load data from Google Sheet or local session logs ---
-    try:
-        raw = get_sheet().get_all_records()
-        df = pd.DataFrame(raw)
-    except Exception:
-        logs = st.session_state.get("_local_logs", [])
-        if logs:
-            df = pd.DataFrame(
-                logs,
-                columns=["timestamp", "user", "product_id", "product_name", "action", "extra"],
-            )
-        else:
-            df = pd.DataFrame(
-                columns=["timestamp", "user", "product_id", "product_name", "action", "extra"]
-            )
+    # --- Load data from the incremental event store (or the local spool) ---
+    df, source = load_events()
 
     if df.empty:
         st.write("No data yet")
@@ -322,48 +524,42 @@ def analytics():
     except Exception:
         df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
 
-    # --- Parse geo/extra JSON into flat columns ---
-    def parse_extra(x):
-        if not x:
-            return {}
-        try:
-            if isinstance(x, str):
-                return json.loads(x)
-            if isinstance(x, dict):
-                return x
-        except Exception:
-            return {}
-        return {}
-
-    extra_parsed = df["extra"].apply(parse_extra)
-    extra_df = pd.json_normalize(extra_parsed).add_prefix("geo_")
+    # geo/extra JSON is already decoded into geo_* columns by the event store
+    analytics_df = clean_df(df)
 
-    analytics_df = pd.concat([df.drop(columns=["extra"]), extra_df], axis=1)
-    analytics_df = clean_df(analytics_df)
+    # Hourly count cube kept in step with the store; rebuilt here only when
+    # the events came from the spool fallback instead of the store.
+    from_store = source == "store"
+    if from_store:
+        rollup = get_event_rollup()
+    else:
+        rollup = EventRollup()
+        rollup.update(analytics_df)
+    cube = rollup.cube()
 
     # --- Raw event log preview ---
     st.subheader("Raw event logs (latest 500)")
-    st.dataframe(analytics_df.sort_values("timestamp", ascending=False).head(500))
+    st.dataframe(analytics_df.nlargest(500, "timestamp"))
 
     # --- Filters ---
     st.subheader("Filters")
     with st.expander("Filter events"):
         col1, col2, col3 = st.columns(3)
         with col1:
-            actions = sorted(analytics_df["action"].dropna().unique().tolist())
+            actions = sorted(cube["action"].dropna().unique().tolist())
             sel_actions = st.multiselect("Action", options=actions, default=actions)
         with col2:
-            prod_names = sorted(analytics_df["product_name"].dropna().unique().tolist())
+            prod_names = sorted(cube["product_name"].dropna().unique().tolist())
             sel_products = st.multiselect("Product", options=prod_names, default=prod_names)
         with col3:
-            users = sorted(analytics_df["user"].dropna().unique().tolist())
+            users = sorted(cube["user"].dropna().unique().tolist())
             sel_users = st.multiselect("User", options=users, default=users)
 
         date_col1, date_col2 = st.columns(2)
         with date_col1:
-            if analytics_df["timestamp"].notna().any():
-                min_date = analytics_df["timestamp"].min().date()
-                max_date = analytics_df["timestamp"].max().date()
+            if cube["hour"].notna().any():
+                min_date = cube["hour"].min().date()
+                max_date = cube["hour"].max().date()
             else:
                 today = datetime.date.today()
                 min_date = max_date = today
@@ -381,58 +577,38 @@ def analytics():
                 value=max_date,
             )
 
-    mask = (
-        analytics_df["action"].isin(sel_actions)
-        & analytics_df["product_name"].isin(sel_products)
-        & analytics_df["user"].isin(sel_users)
-        & (analytics_df["timestamp"].dt.date >= start_date)
-        & (analytics_df["timestamp"].dt.date <= end_date)
-    )
-    filtered = analytics_df[mask].copy()
-    filtered = clean_df(filtered)
+    filtered_cube = rollup.slice(sel_actions, sel_products, sel_users, start_date, end_date)
 
-    if filtered.empty:
+    if filtered_cube.empty:
         st.info("No events for the selected filters.")
         return
 
     # Convenience subsets
-    views = filtered[filtered["action"] == "view"].copy()
-    adds = filtered[filtered["action"] == "add_to_cart"].copy()
-    orders = filtered[filtered["action"] == "order"].copy()
+    views = filtered_cube[filtered_cube["action"] == "view"]
+    adds = filtered_cube[filtered_cube["action"] == "add_to_cart"]
+    orders = filtered_cube[filtered_cube["action"] == "order"]
 
     # --- KPI Cards ---
     st.subheader("Key metrics")
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
     with kpi1:
-        st.metric("Total events", len(filtered))
+        st.metric("Total events", int(filtered_cube["count"].sum()))
     with kpi2:
-        st.metric("Unique users", int(filtered["user"].nunique()))
+        st.metric("Unique users", int(filtered_cube["user"].nunique()))
     with kpi3:
-        st.metric("Total views", int(len(views)))
+        st.metric("Total views", int(views["count"].sum()))
     with kpi4:
-        st.metric("Total orders", int(len(orders)))
+        st.metric("Total orders", int(orders["count"].sum()))
 
     # --- Summary counts by action ---
     st.subheader("Summary counts by action")
-    action_counts = (
-        filtered.groupby("action")
-        .size()
-        .reset_index(name="count")
-        .sort_values("count", ascending=False)
-    )
-    action_counts = clean_df(action_counts)
+    action_counts = clean_df(count_by(filtered_cube, "action"))
     st.dataframe(action_counts)
 
     # --- Clicks by product (views only) ---
     st.subheader("Clicks by product (views only)")
     if not views.empty:
-        clicks_by_product = (
-            views.groupby("product_name")
-            .size()
-            .reset_index(name="views")
-            .sort_values("views", ascending=False)
-        )
-        clicks_by_product = clean_df(clicks_by_product)
+        clicks_by_product = clean_df(count_by(views, "product_name", "views"))
         st.bar_chart(clicks_by_product.set_index("product_name")["views"])
         st.dataframe(clicks_by_product)
     else:
@@ -441,13 +617,7 @@ def analytics():
     # --- Add-to-cart by product ---
     st.subheader("Add-to-cart by product")
     if not adds.empty:
-        adds_by_product = (
-            adds.groupby("product_name")
-            .size()
-            .reset_index(name="adds")
-            .sort_values("adds", ascending=False)
-        )
-        adds_by_product = clean_df(adds_by_product)
+        adds_by_product = clean_df(count_by(adds, "product_name", "adds"))
         st.bar_chart(adds_by_product.set_index("product_name")["adds"])
         st.dataframe(adds_by_product)
     else:
@@ -456,13 +626,7 @@ def analytics():
     # --- Orders by product ---
     st.subheader("Orders by product")
     if not orders.empty:
-        orders_by_product = (
-            orders.groupby("product_name")
-            .size()
-            .reset_index(name="orders")
-            .sort_values("orders", ascending=False)
-        )
-        orders_by_product = clean_df(orders_by_product)
+        orders_by_product = clean_df(count_by(orders, "product_name", "orders"))
         st.bar_chart(orders_by_product.set_index("product_name")["orders"])
         st.dataframe(orders_by_product)
     else:
@@ -471,11 +635,11 @@ def analytics():
     # --- Hourly trend (views) ---
     st.subheader("Hourly trend (views)")
     if not views.empty:
-        views["hour"] = views["timestamp"].dt.hour
-        hourly_series = views.groupby("hour").size()
+        hourly_series = views.groupby(views["hour"].dt.hour)["count"].sum()
         hourly = (
             hourly_series
             .reindex(range(0, 24), fill_value=0)
+            .rename_axis("hour")
             .reset_index(name="views")
         )
         hourly = clean_df(hourly)
@@ -487,10 +651,9 @@ def analytics():
     # --- Daily trend (views) ---
     st.subheader("Daily trend (views)")
     if not views.empty:
-        views["date"] = views["timestamp"].dt.date
         daily = (
-            views.groupby("date")
-            .size()
+            views.groupby(views["hour"].dt.date.rename("date"))["count"]
+            .sum()
             .reset_index(name="views")
             .sort_values("date")
         )
@@ -502,25 +665,14 @@ def analytics():
 
     # --- Top users by events ---
     st.subheader("Top users by events")
-    top_users = (
-        filtered.groupby("user")
-        .size()
-        .reset_index(name="count")
-        .sort_values("count", ascending=False)
-    )
-    top_users = clean_df(top_users)
+    top_users = clean_df(count_by(filtered_cube, "user"))
     st.dataframe(top_users)
     st.bar_chart(top_users.set_index("user")["count"])
 
     # --- Geo distribution (country) ---
     st.subheader("Geo distribution (country)")
-    if "geo_country_name" in analytics_df.columns:
-        country_counts = (
-            filtered["geo_country_name"]
-            .dropna()
-            .value_counts()
-            .reset_index()
-        )
+    if cube["geo_country_name"].notna().any():
+        country_counts = count_by(filtered_cube, "geo_country_name")
         country_counts.columns = ["country", "count"]
         country_counts = clean_df(country_counts)
         if not country_counts.empty:
@@ -533,13 +685,8 @@ def analytics():
 
     # --- Clicks by city ---
     st.subheader("Clicks by city")
-    if "geo_city" in analytics_df.columns:
-        city_counts = (
-            filtered["geo_city"]
-            .dropna()
-            .value_counts()
-            .reset_index()
-        )
+    if cube["geo_city"].notna().any():
+        city_counts = count_by(filtered_cube, "geo_city")
         city_counts.columns = ["city", "count"]
         city_counts = clean_df(city_counts)
         if not city_counts.empty:
@@ -552,12 +699,12 @@ def analytics():
 
     # --- Product vs City heatmap (pivot) ---
     st.subheader("Product vs City heatmap (pivot)")
-    if "geo_city" in analytics_df.columns:
-        pivot = filtered.pivot_table(
+    if cube["geo_city"].notna().any():
+        pivot = filtered_cube.pivot_table(
             index="product_name",
             columns="geo_city",
-            values="action",
-            aggfunc="count",
+            values="count",
+            aggfunc="sum",
             fill_value=0,
         )
         pivot = clean_df(pivot)
@@ -570,10 +717,10 @@ def analytics():
 
     # --- Map of visitor locations ---
     st.subheader("Map of visitor locations (if latitude/longitude present)")
-    if "geo_latitude" in analytics_df.columns and "geo_longitude" in analytics_df.columns:
-        map_df = filtered.dropna(subset=["geo_latitude", "geo_longitude"]).copy()
+    if cube["geo_latitude"].notna().any() and cube["geo_longitude"].notna().any():
+        map_df = filtered_cube.dropna(subset=["geo_latitude", "geo_longitude"])
         try:
-            map_plot = map_df[["geo_latitude", "geo_longitude"]].rename(
+            map_plot = map_df[["geo_latitude", "geo_longitude"]].drop_duplicates().rename(
                 columns={"geo_latitude": "lat", "geo_longitude": "lon"}
             )
             map_plot = clean_df(map_plot)
@@ -588,23 +735,41 @@ def analytics():
 
     # --- Export filtered events ---
     st.subheader("Export filtered events")
-    csv = filtered.to_csv(index=False)
+    export_fmt = st.selectbox("Format", list(EXPORT_FORMATS), key="analytics_export_fmt")
+    ext, mime = EXPORT_FORMATS[export_fmt]
+    if from_store:
+        archive = get_event_archive()
+
+        def export_data():
+            # partition-pruned read, written out one batch at a time
+            frames = archive.iter_batches(start_date, end_date, sel_actions, sel_products, sel_users)
+            return export_bytes((clean_df(f) for f in frames), export_fmt, max_bytes=EXPORT_MAX_BYTES)
+    else:
+        events_df = analytics_df
+
+        def export_data():
+            mask = (
+                events_df["action"].isin(sel_actions)
+                & events_df["product_name"].isin(sel_products)
+                & events_df["user"].isin(sel_users)
+                & (events_df["timestamp"].dt.date >= start_date)
+                & (events_df["timestamp"].dt.date <= end_date)
+            )
+            return export_bytes([clean_df(events_df[mask])], export_fmt, max_bytes=EXPORT_MAX_BYTES)
+
+    # the file is only built when the button is clicked, not on every rerun
     st.download_button(
-        "Download CSV of filtered events",
-        csv,
-        file_name="analytics_filtered.csv",
-        mime="text/csv",
+        f"Download {export_fmt} of filtered events",
+        export_data,
+        file_name=f"analytics_filtered.{ext}",
+        mime=mime,
     )
+    st.caption(f"Exports are limited to {EXPORT_MAX_BYTES // 2**20} MB; narrow the filters for larger ranges.")
 
     # --- Most / Least viewed products ---
     st.subheader("Most / Least viewed products")
     if not views.empty:
-        clicks_by_product = (
-            views.groupby("product_name")
-            .size()
-            .reset_index(name="views")
-            .sort_values("views", ascending=False)
-        )
+        clicks_by_product = count_by(views, "product_name", "views")
         if not clicks_by_product.empty:
             most = clicks_by_product.iloc[0]["product_name"]
             least = clicks_by_product.iloc[-1]["product_name"]
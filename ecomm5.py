@@ -1,6 +1,4 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import datetime
 import pandas as pd
 import os
@@ -17,6 +15,9 @@ if "adds_local" not in st.session_state:
     st.session_state.adds_local = {}
 
 def get_sheet():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds = Credentials.from_service_account_info(
         st.secrets["gcp_service_account"],
         scopes=["https://www.googleapis.com/auth/spreadsheets"]
@@ -1,17 +1,15 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import datetime
 import pandas as pd
-import requests
 import os
 import json
 from collections import Counter
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.linear_model import LogisticRegression
 import numpy as np
-import smtplib
-from email.mime.text import MIMEText
+from geo import GeoCache, lookup_from_env
+from recommendations import RecommendationTable, TableRefresher
+from model_registry import ModelRegistry, SharedModelCache
+from search_index import SearchIndex
+from catalog_snapshot import CatalogSnapshot
 
 st.set_page_config(page_title="E-Commerce Full App", layout="wide")
 
@@ -46,7 +44,48 @@ if os.path.exists(LOCAL_IMAGE_LINKS_PATH):
     except:
         pass
 
+@st.cache_resource
+def get_added_products():
+    """
+    Products added from the admin panel, kept for the life of the process
+    so they survive reruns and stay in step with the search index.
+    """
+    return []
+
+PRODUCTS.extend(get_added_products())
+
+@st.cache_resource
+def get_search_index():
+    """
+    Prefix/BM25 index over product names and categories, built once per
+    process; the admin panel adds new products to it in place.
+    """
+    return SearchIndex.build((p["id"], f"{p['name']} {p.get('category', '')}") for p in PRODUCTS)
+
+@st.cache_resource(max_entries=1)
+def get_catalog(catalog_version):
+    """
+    Sort orders, category posting lists and facet counts for PRODUCTS,
+    recomputed only when the admin panel has added products.
+    """
+    return CatalogSnapshot.from_products(PRODUCTS)
+
+# product page sort labels -> CatalogSnapshot sort keys
+SORT_OPTIONS = {
+    "Default": None,
+    "Price: Low to High": "price",
+    "Price: High to Low": "-price",
+    "Name A-Z": "name",
+    "Name Z-A": "-name",
+}
+
+# products per page on the product grid (a multiple of its 3 columns)
+PAGE_SIZE = 12
+
 def get_sheet():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds = Credentials.from_service_account_info(
         st.secrets["gcp_service_account"],
         scopes=["https://www.googleapis.com/auth/spreadsheets"]
@@ -101,11 +140,24 @@ def ensure_client_ip():
     st.components.v1.html(html, height=0)
     st.session_state.client_ip_checked = True
 
+@st.cache_resource
+def get_geo_cache():
+    """
+    IP -> geo answers shared by all sessions, so a returning visitor
+    never costs another lookup. Resolved from the offline range file
+    first (GEO_RANGES_CSV), ipapi.co only for misses.
+    """
+    return GeoCache(
+        lookup=lookup_from_env(),
+        maxsize=int(os.environ.get("GEO_CACHE_SIZE", 10000)),
+        ttl=int(os.environ.get("GEO_CACHE_TTL", 86400)),
+        negative_ttl=int(os.environ.get("GEO_CACHE_NEGATIVE_TTL", 300)),
+    )
+
 def get_geo_for_ip(ip):
     try:
-        r = requests.get(f"https://ipapi.co/{ip}/json/", timeout=5)
-        if r.status_code == 200:
-            data = r.json()
+        if ip:
+            data = get_geo_cache().get(ip)
             return {
                 "ip": ip,
                 "city": data.get("city"),
@@ -121,6 +173,9 @@ def get_geo_for_ip(ip):
     return {"ip": ip}
 
 def send_email_report(to_email, subject, html_body):
+    import smtplib
+    from email.mime.text import MIMEText
+
     try:
         cfg = st.secrets.get("email", {})
         smtp_host = cfg.get("smtp_host")
@@ -144,59 +199,73 @@ def send_email_report(to_email, subject, html_body):
         st.error(f"Failed to send email: {e}")
         return False
 
+RECS_PATH = os.environ.get("RECOMMENDATIONS_PATH", "recommendations.json")
+
+@st.cache_resource
+def get_recommendations():
+    """
+    Top products per user, rebuilt from the sheet in the background every
+    few minutes and saved to RECS_PATH between restarts.
+    """
+    def build():
+        rows = get_sheet().get_all_records()
+        if not rows:
+            return RecommendationTable()
+        df = pd.DataFrame(rows)
+        return RecommendationTable.from_views(df[df["action"] == "view"], topn=10)
+
+    return TableRefresher(build, RECS_PATH, interval=600)
+
 def basic_recommender_for_user(username, topn=3):
-    try:
-        ws = get_sheet()
-        rows = ws.get_all_records()
-    except:
-        rows = st.session_state.get("_local_logs", [])
-    if not rows:
-        return [p["name"] for p in PRODUCTS[:topn]]
-    df = pd.DataFrame(rows, columns=["timestamp", "user", "product_id", "product_name", "action"][:5]) if isinstance(rows[0], list) else pd.DataFrame(rows)
-    df = df[df["action"] == "view"]
-    if username and username != "guest":
-        user_views = df[df["user"] == username]
-        if not user_views.empty:
-            most_viewed = user_views["product_name"].value_counts().index.tolist()
-            recs = most_viewed + df["product_name"].value_counts().index.tolist()
-            seen = set()
-            out = []
-            for r in recs:
-                if r not in seen:
-                    seen.add(r)
-                    out.append(r)
-                if len(out) >= topn:
-                    break
-            return out
-    pop = df["product_name"].value_counts().index.tolist()
-    if not pop:
-        return [p["name"] for p in PRODUCTS[:topn]]
-    return pop[:topn]
+    recs = get_recommendations().lookup(username, topn)
+    return recs or [p["name"] for p in PRODUCTS[:topn]]
+
+MODEL_DIR = os.environ.get("MODEL_REGISTRY_DIR", "models")
+
+@st.cache_resource
+def get_model_cache():
+    """
+    Published models loaded once per process and shared by all sessions.
+    """
+    return SharedModelCache(ModelRegistry(MODEL_DIR))
 
 def train_simple_ml():
+    shared = True
     try:
         ws = get_sheet()
         rows = ws.get_all_records()
     except:
         rows = st.session_state.get("_local_logs", [])
+        shared = False
     if not rows:
         return None
-    df = pd.DataFrame(rows)
-    df = df[df["action"] == "view"]
-    if df.empty:
-        return None
-    df["text"] = df["user"].astype(str) + " " + df["product_name"].astype(str)
-    vec = CountVectorizer()
-    X = vec.fit_transform(df["text"])
-    y = df["product_name"].astype("category").cat.codes
-    if X.shape[0] < 5:
-        return None
-    model = LogisticRegression(max_iter=200)
-    try:
-        model.fit(X, y)
-        return (model, vec, df["product_name"].astype("category").cat.categories)
-    except:
-        return None
+
+    def train():
+        from sklearn.feature_extraction.text import CountVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        df = pd.DataFrame(rows)
+        df = df[df["action"] == "view"]
+        if df.empty:
+            return None
+        df["text"] = df["user"].astype(str) + " " + df["product_name"].astype(str)
+        vec = CountVectorizer()
+        X = vec.fit_transform(df["text"])
+        y = df["product_name"].astype("category").cat.codes
+        if X.shape[0] < 5:
+            return None
+        model = LogisticRegression(max_iter=200)
+        try:
+            model.fit(X, y)
+            return (model, vec, df["product_name"].astype("category").cat.categories)
+        except:
+            return None
+
+    if not shared:
+        # this session's own rows: never published for other sessions
+        return train()
+    # the sheet only grows, so an unchanged row count means nothing to retrain
+    return get_model_cache().get_or_train("simple_ml", len(rows), train, fmt="joblib")
 
 def login():
     st.header("Login")
@@ -234,23 +303,21 @@ def add_to_cart(product, qty):
 def product_page():
     st.header("Products")
     search = st.text_input("Search", key="search")
-    cats = sorted(list({p["category"] for p in PRODUCTS}))
-    selected = st.multiselect("Filter by category", options=cats, key="cats")
-    sort = st.selectbox("Sort by", ["Default", "Price: Low to High", "Price: High to Low", "Name A-Z", "Name Z-A"], key="sort")
-    filtered = PRODUCTS
-    if search:
-        q = search.lower()
-        filtered = [p for p in filtered if q in p["name"].lower() or q in p.get("category","").lower()]
-    if selected:
-        filtered = [p for p in filtered if p["category"] in selected]
-    if sort == "Price: Low to High":
-        filtered = sorted(filtered, key=lambda x: x["price"])
-    elif sort == "Price: High to Low":
-        filtered = sorted(filtered, key=lambda x: -x["price"])
-    elif sort == "Name A-Z":
-        filtered = sorted(filtered, key=lambda x: x["name"])
-    elif sort == "Name Z-A":
-        filtered = sorted(filtered, key=lambda x: x["name"], reverse=True)
+    catalog = get_catalog(len(PRODUCTS))
+    selected = st.multiselect("Filter by category", options=catalog.categories, key="cats",
+                              format_func=lambda c: f"{c} ({catalog.facets[c]})")
+    sort = st.selectbox("Sort by", list(SORT_OPTIONS), key="sort")
+    ids = get_search_index().search(search) if search else None
+    rows = catalog.select(selected, ids, SORT_OPTIONS[sort])
+    pages = max(1, -(-len(rows) // PAGE_SIZE))
+    # a new search, filter or sort starts again from page 1
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                           key=f"page_{search}_{selected}_{sort}") if pages > 1 else 1
+    start = (page - 1) * PAGE_SIZE
+    if len(rows):
+        st.caption(f"Showing {start + 1}-{min(start + PAGE_SIZE, len(rows))} of {len(rows)} products")
+    # only the visible page gets widgets and images
+    filtered = catalog.take(rows[start:start + PAGE_SIZE])
     cols = st.columns(3)
     for i, p in enumerate(filtered):
         with cols[i % 3]:
@@ -313,7 +380,10 @@ def admin_panel():
         img = st.text_input("Image URL", key="np_img")
         if st.button("Add product now"):
             new_id = max([p["id"] for p in PRODUCTS]) + 1
-            PRODUCTS.append({"id": new_id, "name": name, "price": price, "category": cat or "Uncategorized", "img": img})
+            product = {"id": new_id, "name": name, "price": price, "category": cat or "Uncategorized", "img": img}
+            PRODUCTS.append(product)
+            get_added_products().append(product)
+            get_search_index().add(new_id, f"{name} {product['category']}")
             st.success("Product added")
             st.experimental_rerun()
 
@@ -0,0 +1,300 @@
+import atexit
+import glob
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import pandas as pd
+
+# Columns the dashboard filters on are dictionary-encoded; `action` and the
+# event date are hive partition keys and are not stored inside the files.
+STRING_COLUMNS = ("product_id", "geo_ip", "geo_city", "geo_region", "geo_country_name")
+DICT_COLUMNS = ("user", "product_name")
+FLOAT_COLUMNS = ("geo_latitude", "geo_longitude")
+COLUMN_ORDER = (
+    "timestamp", "user", "product_id", "product_name", "action",
+    "geo_ip", "geo_city", "geo_region", "geo_country_name", "geo_latitude", "geo_longitude",
+)
+
+
+def _schema():
+    import pyarrow as pa
+
+    fields = [pa.field("timestamp", pa.timestamp("ns"))]
+    fields += [pa.field(c, pa.dictionary(pa.int32(), pa.string())) for c in DICT_COLUMNS]
+    fields += [pa.field(c, pa.string()) for c in STRING_COLUMNS]
+    fields += [pa.field(c, pa.float64()) for c in FLOAT_COLUMNS]
+    return pa.schema(fields)
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(
+        pa.schema([("date", pa.string()), ("action", pa.string())]), flavor="hive"
+    )
+
+
+class EventArchive:
+    """
+    Parquet archive of decoded events under `root`, partitioned as
+    date=YYYY-MM-DD/action=<action>/.
+
+    Rows are buffered as they arrive (`apply()` is an EventStore listener)
+    and written out by `flush()`, either from the background timer or once
+    `max_pending` rows are buffered. `query()` prunes partitions by date and
+    action, pushes product/user filters down to the row groups and reads
+    only the requested columns; rows not flushed yet are merged in from
+    memory so results are never stale. `iter_batches()` does the same
+    chunk by chunk for exports.
+
+    The number of source rows already archived is persisted next to the
+    data, so a store that replays the whole sheet after a restart does not
+    produce duplicates; a replay shorter than that count rebuilds the
+    archive (see apply()).
+    """
+
+    def __init__(self, root="event_archive", flush_interval=300.0, max_pending=50000):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        os.makedirs(root, exist_ok=True)
+        self._state_path = os.path.join(root, "_state.json")
+        self._lock = threading.RLock()
+        self._pending = []
+        self._seen = 0
+        self._replaying = False
+        self._readers = 0
+        self.rebuilds = 0
+        self._archived = self._load_state()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="event-archive", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _load_state(self):
+        try:
+            with open(self._state_path) as f:
+                return int(json.load(f).get("rows_archived", 0))
+        except (OSError, ValueError):
+            return 0
+
+    def _save_state(self):
+        tmp = self._state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"rows_archived": self._archived}, f)
+        os.replace(tmp, self._state_path)
+
+    def apply(self, new_rows, reset=False):
+        """
+        EventStore listener: buffer rows past the persisted high-water mark.
+
+        After a reset the store replays the sheet from its first row and
+        the first non-empty delivery is the whole sheet. If that is shorter
+        than what was archived, the counter no longer describes the sheet
+        (rows were deleted, or the state outlived its data) and the archive
+        is rebuilt from the replayed rows instead of skipping them.
+        """
+        with self._lock:
+            if reset:
+                # buffered rows are part of the replay that follows
+                self._seen = 0
+                self._pending = []
+                self._replaying = True
+            if new_rows is None or new_rows.empty:
+                return
+            if self._replaying:
+                self._replaying = False
+                if len(new_rows) < self._archived:
+                    self._clear_archive()
+            skip = max(0, self._archived - self._seen)
+            self._seen += len(new_rows)
+            if skip < len(new_rows):
+                self._pending.append(new_rows.iloc[skip:])
+            pending = sum(len(p) for p in self._pending)
+        if pending >= self.max_pending:
+            self.flush()
+
+    def _clear_archive(self):
+        # caller holds self._lock
+        for part in glob.glob(os.path.join(self.root, "date=*")):
+            shutil.rmtree(part, ignore_errors=True)
+        self._archived = 0
+        self._save_state()
+        self.rebuilds += 1
+
+    def _pending_frame(self):
+        if not self._pending:
+            return None
+        return pd.concat(self._pending, ignore_index=True)
+
+    def _to_table(self, df):
+        import pyarrow as pa
+
+        df = df.copy()
+        for c in DICT_COLUMNS + STRING_COLUMNS:
+            if c not in df.columns:
+                df[c] = None
+            df[c] = df[c].astype(object).where(df[c].notna(), None)
+            df[c] = df[c].map(lambda v: v if v is None else str(v))
+        for c in FLOAT_COLUMNS:
+            df[c] = pd.to_numeric(df[c], errors="coerce") if c in df.columns else float("nan")
+        df["date"] = df["timestamp"].dt.strftime("%Y-%m-%d").fillna("unknown")
+        df["action"] = df["action"].fillna("unknown").astype(str)
+        schema = _schema()
+        for name in ("date", "action"):
+            schema = schema.append(pa.field(name, pa.string()))
+        return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+    def flush(self):
+        """
+        Write buffered rows as new parquet files in their partitions.
+        """
+        import pyarrow.dataset as ds
+
+        with self._lock:
+            df = self._pending_frame()
+            if df is None:
+                return 0
+            ds.write_dataset(
+                self._to_table(df),
+                self.root,
+                format="parquet",
+                partitioning=_partitioning(),
+                basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            self._pending = []
+            self._archived += len(df)
+            self._save_state()
+            return len(df)
+
+    def compact(self, min_files=8):
+        """
+        Merge partitions that accumulated `min_files` or more small files
+        into a single file each.
+        """
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        merged = 0
+        with self._lock:
+            if self._readers:
+                return 0
+            for part in glob.glob(os.path.join(self.root, "date=*", "action=*")):
+                files = sorted(glob.glob(os.path.join(part, "*.parquet")))
+                if len(files) < min_files:
+                    continue
+                table = ds.dataset(files, format="parquet", schema=_schema()).to_table()
+                name = f"part-{uuid.uuid4().hex}-c.parquet"
+                # leading underscore keeps the half-written file out of dataset discovery
+                tmp = os.path.join(part, "_" + name)
+                pq.write_table(table, tmp)
+                os.replace(tmp, os.path.join(part, name))
+                for f in files:
+                    os.remove(f)
+                merged += 1
+        return merged
+
+    def iter_batches(self, start_date=None, end_date=None, actions=None, products=None,
+                     users=None, columns=None, batch_size=50000):
+        """
+        Yield matching events as DataFrame chunks of at most `batch_size`
+        rows, reading only the needed partitions and columns.
+        """
+        import pyarrow.dataset as ds
+
+        expr = None
+
+        def add(e):
+            return e if expr is None else expr & e
+
+        if start_date is not None:
+            expr = add(ds.field("date") >= start_date.isoformat())
+        if end_date is not None:
+            expr = add(ds.field("date") <= end_date.isoformat())
+        if actions is not None:
+            expr = add(ds.field("action").isin(list(actions)))
+        if products is not None:
+            expr = add(ds.field("product_name").isin(list(products)))
+        if users is not None:
+            expr = add(ds.field("user").isin(list(users)))
+
+        order = list(columns) if columns is not None else list(COLUMN_ORDER)
+
+        def ordered(df):
+            return df[[c for c in order if c in df.columns]]
+
+        # snapshot the file list; compact() leaves files alone while we read
+        with self._lock:
+            pending = self._pending_frame()
+            files = glob.glob(os.path.join(self.root, "date=*", "action=*", "*.parquet"))
+            self._readers += 1
+        try:
+            if files:
+                schema = _schema()
+                for name in ("date", "action"):
+                    schema = schema.append(_partitioning().schema.field(name))
+                dataset = ds.dataset(
+                    files, format="parquet", schema=schema,
+                    partitioning=_partitioning(), partition_base_dir=self.root,
+                )
+                cols = [c for c in order if c in schema.names]
+                for batch in dataset.to_batches(columns=cols, filter=expr, batch_size=batch_size):
+                    if batch.num_rows == 0:
+                        continue
+                    df = batch.to_pandas()
+                    for c in DICT_COLUMNS:
+                        if c in df.columns:
+                            df[c] = df[c].astype(object)
+                    yield ordered(df)
+        finally:
+            with self._lock:
+                self._readers -= 1
+
+        if pending is not None:
+            mask = pd.Series(True, index=pending.index)
+            if start_date is not None:
+                mask &= pending["timestamp"].dt.date >= start_date
+            if end_date is not None:
+                mask &= pending["timestamp"].dt.date <= end_date
+            if actions is not None:
+                mask &= pending["action"].isin(actions)
+            if products is not None:
+                mask &= pending["product_name"].isin(products)
+            if users is not None:
+                mask &= pending["user"].isin(users)
+            tail = pending[mask]
+            for i in range(0, len(tail), batch_size):
+                yield ordered(tail.iloc[i:i + batch_size])
+
+    def query(self, start_date=None, end_date=None, actions=None, products=None,
+              users=None, columns=None):
+        """
+        Matching events as one DataFrame (see iter_batches).
+        """
+        frames = list(self.iter_batches(start_date, end_date, actions, products, users, columns))
+        if not frames:
+            return pd.DataFrame(columns=list(columns) if columns is not None else list(COLUMN_ORDER))
+        return pd.concat(frames, ignore_index=True)
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(5)
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.compact()
+            except Exception:
+                pass
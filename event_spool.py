@@ -0,0 +1,181 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+from event_writer import PartialWriteError
+
+
+class EventSpool:
+    """
+    Append-only on-disk queue of event rows (SQLite in WAL mode).
+
+    Rows that could not be delivered to the backend are appended here and
+    survive reruns, session expiry and restarts. Every session in the process
+    shares one spool, and several processes may share the file: `claim()`
+    leases entries to one replayer at a time, so two replayers never send the
+    same rows. A lease left behind by a crashed replayer expires on its own.
+    """
+
+    def __init__(self, path="event_spool.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created REAL NOT NULL, "
+            "row TEXT NOT NULL)"
+        )
+        # spools written before leases existed lack the column
+        columns = [c[1] for c in self._conn.execute("PRAGMA table_info(spool)")]
+        if "leased_until" not in columns:
+            self._conn.execute("ALTER TABLE spool ADD COLUMN leased_until REAL NOT NULL DEFAULT 0")
+
+    def append(self, rows):
+        now = time.time()
+        data = [(now, json.dumps(r, default=str)) for r in rows]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT INTO spool (created, row) VALUES (?, ?)", data)
+
+    def peek(self, limit=500):
+        """
+        Oldest `limit` entries as (id, row) pairs, without removing them.
+        """
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT id, row FROM spool ORDER BY id LIMIT ?", (limit,)
+            )
+            return [(i, json.loads(r)) for i, r in cur.fetchall()]
+
+    def claim(self, limit=500, lease=300.0):
+        """
+        Oldest `limit` unleased entries as (id, row) pairs, leased for
+        `lease` seconds. Until they are acked, released or the lease runs
+        out no other claim() -- in this or another process -- returns them.
+        """
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock before the SELECT, so two
+            # processes cannot both read the same unleased rows
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                entries = self._conn.execute(
+                    "SELECT id, row FROM spool WHERE leased_until < ? ORDER BY id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE spool SET leased_until = ? WHERE id = ?",
+                    [(now + lease, i) for i, _ in entries],
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return [(i, json.loads(r)) for i, r in entries]
+
+    def release(self, ids):
+        """
+        Give up the lease on entries that could not be delivered.
+        """
+        if not ids:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("UPDATE spool SET leased_until = 0 WHERE id = ?", [(i,) for i in ids])
+
+    def ack(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("DELETE FROM spool WHERE id = ?", [(i,) for i in ids])
+
+    def rows(self):
+        with self._lock:
+            cur = self._conn.execute("SELECT row FROM spool ORDER BY id")
+            return [json.loads(r) for (r,) in cur.fetchall()]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SpoolReplayer:
+    """
+    Background thread that drains an EventSpool into `sink` in batches.
+
+    `sink(rows)` must raise if delivery failed; entries are only removed
+    after it returns. A sink that raises PartialWriteError has delivered
+    all but the rows at its `indices`: the rest are removed, and the
+    rejected ones keep their lease, so they are retried only once it
+    expires and do not hold up the rows behind them. While the backend is
+    down the retry delay doubles up to `max_backoff` seconds, and resets
+    after the first successful batch.
+    """
+
+    def __init__(self, spool, sink, batch_size=200, interval=5.0, max_backoff=300.0):
+        self.spool = spool
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.replayed = 0
+        self.rejected = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def drain_once(self):
+        """
+        Replay batches until no unleased entries are left; returns rows
+        delivered. Raises whatever the sink raised on failure, or the last
+        PartialWriteError once the other rows are drained.
+        """
+        delivered = 0
+        partial = None
+        while True:
+            entries = self.spool.claim(self.batch_size)
+            if not entries:
+                if partial is not None:
+                    raise partial
+                return delivered
+            ids = [i for i, _ in entries]
+            try:
+                self.sink([row for _, row in entries])
+            except PartialWriteError as e:
+                partial = e
+                rejected = set(e.indices or ())
+                self.rejected += len(rejected)
+                ids = [i for n, i in enumerate(ids) if n not in rejected]
+            except Exception:
+                self.spool.release(ids)
+                raise
+            self.spool.ack(ids)
+            delivered += len(ids)
+            self.replayed += len(ids)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.wait(delay):
+            try:
+                self.drain_once()
+                self.last_error = None
+                delay = self.interval
+            except Exception as e:
+                self.last_error = repr(e)
+                delay = min(delay * 2, self.max_backoff)
@@ -0,0 +1,248 @@
+import collections
+import json
+import threading
+import time
+
+import pandas as pd
+
+from sheets import EVENT_HEADER
+
+
+# Keys of the JSON "extra" column the dashboard actually reads.
+EXTRA_KEYS = ("ip", "city", "region", "country_name", "latitude", "longitude")
+NUMERIC_EXTRA_KEYS = ("latitude", "longitude")
+
+
+def _loads_one(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {}
+
+
+def decode_extra_column(values, keys=EXTRA_KEYS, prefix="geo_"):
+    """
+    Decode a column of JSON objects into typed `geo_*` columns.
+
+    The whole column is parsed with a single json.loads call over a JSON
+    array built from the cells; only if some cell is malformed does it fall
+    back to parsing cell by cell. Keys outside `keys` are dropped.
+    """
+    texts = []
+    for v in values:
+        if isinstance(v, dict):
+            texts.append(json.dumps(v))
+        elif isinstance(v, str) and v.strip():
+            texts.append(v)
+        else:
+            texts.append("{}")
+    try:
+        parsed = json.loads("[" + ",".join(texts) + "]")
+        if len(parsed) != len(texts):
+            raise ValueError("cell is not a single JSON value")
+    except ValueError:
+        parsed = [_loads_one(t) for t in texts]
+    records = [p if isinstance(p, dict) else {} for p in parsed]
+    cols = {}
+    for k in keys:
+        col = [r.get(k) for r in records]
+        if k in NUMERIC_EXTRA_KEYS:
+            cols[prefix + k] = pd.to_numeric(pd.Series(col, dtype=object), errors="coerce")
+        else:
+            cols[prefix + k] = pd.Series(col, dtype=object)
+    return pd.DataFrame(cols)
+
+
+def decode_events(df):
+    """
+    Replace the raw `extra` column of an event frame with decoded columns.
+    """
+    extra = decode_extra_column(df["extra"].tolist())
+    extra.index = df.index
+    return pd.concat([df.drop(columns=["extra"]), extra], axis=1)
+
+
+def fill_geo(df, lookup, keys=EXTRA_KEYS, prefix="geo_"):
+    """
+    Fill the geo columns of rows that were logged with only an IP (their
+    lookup was still running) from `lookup(ip)`, a cached answer or None.
+    """
+    ip_col = prefix + "ip"
+    geo_cols = [prefix + k for k in keys if k != "ip"]
+    missing = df[ip_col].notna() & df[geo_cols].isna().all(axis=1)
+    if not missing.any():
+        return df
+    ips = df.loc[missing, ip_col]
+    answers = {ip: lookup(ip) or {} for ip in ips.unique()}
+    filled = decode_extra_column([answers[ip] for ip in ips], keys, prefix)
+    filled.index = ips.index
+    for c in geo_cols:
+        df.loc[missing, c] = filled[c]
+    return df
+
+
+def _col(n):
+    # 1-based column number -> A1 letter(s)
+    s = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(ord("A") + r) + s
+    return s
+
+
+class EventStore:
+    """
+    Local, incrementally refreshed copy of the event worksheet.
+
+    The store remembers the last sheet row it ingested and each refresh only
+    reads the rows after it, in ranged chunks, so the cost of a dashboard
+    rerun grows with new events rather than with the whole history. The
+    last ingested row is re-read as part of each refresh; if it no longer
+    matches (rows deleted or the sheet was rewritten) the store reloads
+    from scratch.
+
+    The `extra` column is decoded into `geo_*` columns as rows are ingested,
+    so each row's JSON is parsed exactly once for the life of the process.
+    With `geo`, rows that carry only an IP are filled from `geo(ip)` (e.g.
+    GeoCache.peek) at that point, before listeners see them.
+
+    Listeners are called after the store lock is released, one chunk at a
+    time and in ingestion order, so a slow listener does not block readers
+    and a listener may read the store. A listener that raises is recorded
+    in `last_error` and does not stop the others.
+    """
+
+    def __init__(self, get_worksheet, header=EVENT_HEADER, chunk_rows=5000, max_age=5.0, geo=None):
+        self.get_worksheet = get_worksheet
+        self.geo = geo
+        self.header = list(header)
+        self.chunk_rows = chunk_rows
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._frame = self._empty()
+        self._last_row = None
+        self._next_row = 2  # row 1 is the header
+        self._refreshed = 0.0
+        self._listeners = []
+        # (listeners, new_rows, reset) queued under _lock, delivered in
+        # order under _deliver_lock once _lock is released
+        self._outbox = collections.deque()
+        self._deliver_lock = threading.Lock()
+        self.rows_fetched = 0
+        self.reloads = 0
+        self.listener_errors = 0
+        self.last_error = None
+
+    def add_listener(self, fn):
+        """
+        Call `fn(new_rows, reset)` with every chunk of newly ingested rows;
+        `reset` is True when previously delivered rows must be discarded.
+        The listener is immediately replayed the rows ingested so far.
+        """
+        with self._lock:
+            self._listeners.append(fn)
+            # chunks still queued are already part of _frame, and are only
+            # addressed to the listeners registered before this one
+            self._outbox.append(([fn], self._frame, True))
+        self._deliver()
+
+    def _notify(self, new_rows, reset):
+        # called under _lock; _deliver() runs the listeners once it is released
+        self._outbox.append((list(self._listeners), new_rows, reset))
+
+    def _deliver(self):
+        with self._deliver_lock:
+            while True:
+                with self._lock:
+                    if not self._outbox:
+                        return
+                    listeners, new_rows, reset = self._outbox.popleft()
+                for fn in listeners:
+                    try:
+                        fn(new_rows, reset)
+                    except Exception as e:
+                        self.listener_errors += 1
+                        self.last_error = repr(e)
+
+    def _empty(self):
+        return self._to_frame([])
+
+    def _pad(self, row):
+        width = len(self.header)
+        return (list(row) + [""] * width)[:width]
+
+    def _to_frame(self, rows):
+        df = pd.DataFrame(rows, columns=self.header)
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+        df = decode_events(df)
+        if self.geo is not None and len(df):
+            df = fill_geo(df, self.geo)
+        return df
+
+    def _fetch(self, ws, first):
+        rows = []
+        end_col = _col(len(self.header))
+        while True:
+            last = first + self.chunk_rows - 1
+            chunk = [self._pad(r) for r in ws.get_values(f"A{first}:{end_col}{last}")]
+            rows.extend(chunk)
+            if len(chunk) < self.chunk_rows:
+                return rows
+            first = last + 1
+
+    def refresh(self, force=False):
+        """
+        Pull rows appended since the last refresh and return the full frame.
+        Calls within `max_age` seconds of the previous refresh are served
+        from memory. Listeners have seen the new rows when this returns.
+
+        The frame is a shallow copy: callers may add or replace columns, but
+        must not modify values in place, which would change the store's rows.
+        """
+        try:
+            return self._refresh(force)
+        finally:
+            self._deliver()
+
+    def _refresh(self, force):
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed < self.max_age:
+                return self._frame.copy(deep=False)
+            ws = self.get_worksheet()
+            if self._last_row is None:
+                new = self._fetch(ws, self._next_row)
+            else:
+                new = self._fetch(ws, self._next_row - 1)
+                if not new or new[0] != self._last_row:
+                    self.reloads += 1
+                    self._frame = self._empty()
+                    self._next_row = 2
+                    self._notify(self._frame, True)
+                    new = self._fetch(ws, self._next_row)
+                else:
+                    new = new[1:]
+            if new:
+                self._last_row = new[-1]
+                self._next_row += len(new)
+                self.rows_fetched += len(new)
+                chunk = self._to_frame(new)
+                if self._frame.empty:
+                    self._frame = chunk
+                else:
+                    self._frame = pd.concat([self._frame, chunk], ignore_index=True)
+                self._notify(chunk, False)
+            elif self._frame.empty:
+                self._last_row = None
+            self._refreshed = time.monotonic()
+            return self._frame.copy(deep=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rows": len(self._frame),
+                "next_row": self._next_row,
+                "rows_fetched": self.rows_fetched,
+                "reloads": self.reloads,
+                "listener_errors": self.listener_errors,
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,238 @@
+import atexit
+import collections
+import queue
+import threading
+import time
+
+
+class _Group:
+    # rows queued by submit_many() that must land in the same batch
+    __slots__ = ("rows",)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+class PartialWriteError(Exception):
+    """
+    Raised by a writer's delivery when only `rows` out of the batch were
+    rejected; the rest of the batch was written. `indices` are the rejected
+    rows' positions in the batch.
+    """
+
+    def __init__(self, rows, cause, indices=None):
+        super().__init__(f"{len(rows)} rows rejected: {cause!r}")
+        self.rows = rows
+        self.cause = cause
+        self.indices = indices
+
+
+# Mongo's duplicate-key error: the document is already stored
+DUPLICATE_KEY = 11000
+
+
+def insert_documents(collection, docs):
+    """
+    insert_many(docs, ordered=False) that, when some documents fail, raises
+    PartialWriteError naming only those. Unordered inserts keep going past
+    a bad document, so everything else was written. Duplicate-key errors
+    count as written, so re-sending a batch that carries its `_id`s is
+    safe.
+    """
+    from pymongo.errors import BulkWriteError
+
+    try:
+        collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # with only writeConcernErrors every document was applied on the
+        # primary, so none of them is re-sent
+        errors = e.details.get("writeErrors", [])
+        indices = [err["index"] for err in errors if err.get("code") != DUPLICATE_KEY]
+        raise PartialWriteError([docs[i] for i in indices], e, indices)
+
+
+class BufferedEventWriter:
+    """
+    Queue event rows in memory and append them to a worksheet in batches
+    from a background thread.
+
+    A batch is flushed when it reaches `max_batch` rows or when the oldest
+    queued row has waited `flush_interval` seconds, whichever comes first.
+    `get_worksheet` is called once per flush so the caller controls how the
+    worksheet handle is obtained; `on_write_error`, if given, is called with
+    the exception of every failed flush (e.g. to drop a stale cached handle).
+    When a flush raises PartialWriteError only its `rows` count as failed.
+    """
+
+    def __init__(self, get_worksheet, max_batch=50, flush_interval=2.0,
+                 max_failed=5000, on_error=None, on_write_error=None):
+        self.get_worksheet = get_worksheet
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.on_write_error = on_write_error
+        self._queue = queue.Queue()
+        self._failed = collections.deque(maxlen=max_failed)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._rows_written = 0
+        self._batches_written = 0
+        self._failed_batches = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name="event-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, row):
+        """
+        Queue a single row. Never blocks on the network.
+        """
+        if self._stop.is_set():
+            self._write([row])
+            return
+        self._queue.put(row)
+
+    def submit_many(self, rows):
+        """
+        Queue several rows that are written together in one batch.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        if self._stop.is_set():
+            self._write(rows)
+            return
+        self._queue.put(_Group(rows))
+
+    def flush(self, timeout=10.0):
+        """
+        Block until every row queued before this call has been written.
+        """
+        if self._stop.is_set():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """
+        Stop the background thread after draining the queue.
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def failed_rows(self):
+        with self._lock:
+            return list(self._failed)
+
+    def stats(self):
+        with self._lock:
+            batches = self._batches_written + self._failed_batches
+            return {
+                "queue_depth": self._queue.qsize(),
+                "rows_written": self._rows_written,
+                "batches_written": self._batches_written,
+                "failed_batches": self._failed_batches,
+                "failed_rows": len(self._failed),
+                "last_flush_ms": round(self._last_flush_ms, 2),
+                "avg_flush_ms": round(self._total_flush_ms / batches, 2) if batches else 0.0,
+                "max_flush_ms": round(self._max_flush_ms, 2),
+            }
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else 0.5
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, threading.Event):
+                # flush() marker: everything queued before it is already in batch
+                if batch:
+                    self._write(batch)
+                    batch, deadline = [], None
+                item.set()
+                continue
+            if isinstance(item, _Group):
+                batch.extend(item.rows)
+            elif item is not None:
+                batch.append(item)
+            if item is not None:
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (len(batch) >= self.max_batch or time.monotonic() >= deadline):
+                self._write(batch)
+                batch, deadline = [], None
+            if self._stop.is_set() and self._queue.empty():
+                if batch:
+                    self._write(batch)
+                return
+
+    def _deliver(self, rows):
+        self.get_worksheet().append_rows(rows, value_input_option="RAW")
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        error = None
+        failed = rows
+        try:
+            self._deliver(rows)
+        except PartialWriteError as e:
+            error, failed = e, e.rows
+        except Exception as e:
+            error = e
+            if self.on_write_error is not None:
+                try:
+                    self.on_write_error(e)
+                except Exception:
+                    pass
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._last_flush_ms = elapsed
+            self._max_flush_ms = max(self._max_flush_ms, elapsed)
+            self._total_flush_ms += elapsed
+            if error is None:
+                self._rows_written += len(rows)
+                self._batches_written += 1
+            else:
+                self._rows_written += len(rows) - len(failed)
+                self._failed_batches += 1
+                if self.on_error is None:
+                    self._failed.extend(failed)
+        if error is not None and failed and self.on_error is not None:
+            try:
+                self.on_error(failed, error)
+            except Exception:
+                with self._lock:
+                    self._failed.extend(failed)
+
+
+class MongoEventWriter(BufferedEventWriter):
+    """
+    BufferedEventWriter that sends each batch to a MongoDB collection with
+    one unordered insert_many (see insert_documents). Pass `w=0` for
+    fire-and-forget telemetry writes (failures are then not reported back).
+    """
+
+    DUPLICATE_KEY = DUPLICATE_KEY
+
+    def __init__(self, collection, w=None, **kwargs):
+        if w is not None:
+            from pymongo import WriteConcern
+
+            collection = collection.with_options(write_concern=WriteConcern(w=w))
+        self.collection = collection
+        super().__init__(None, **kwargs)
+
+    def _deliver(self, docs):
+        insert_documents(self.collection, docs)
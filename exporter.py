@@ -0,0 +1,139 @@
+import json
+import tempfile
+
+import pandas as pd
+
+# label -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "JSONL": ("jsonl", "application/x-ndjson"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# st.download_button holds the whole file in server memory, so exports
+# handed to it are capped
+MAX_EXPORT_BYTES = 200 * 1024 * 1024
+
+
+class ExportTooLarge(ValueError):
+    pass
+
+
+def iter_cursor_frames(cursor, chunk_size=5000):
+    """
+    DataFrames of at most `chunk_size` documents from a pymongo cursor.
+    """
+    chunk = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= chunk_size:
+            yield pd.DataFrame(chunk)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk)
+
+
+def _flatten_nested(df):
+    # nested documents (e.g. Mongo `extra`) are written as JSON text; for
+    # parquet this also avoids struct types that change between chunks
+    for c in df.columns:
+        if df[c].dtype == object and df[c].map(lambda v: isinstance(v, (dict, list))).any():
+            df = df.assign(**{c: df[c].map(lambda v: json.dumps(v, default=str) if isinstance(v, (dict, list)) else v)})
+    return df
+
+
+def _write_csv(frames, out):
+    header = True
+    for df in frames:
+        out.write(_flatten_nested(df).to_csv(index=False, header=header).encode("utf-8"))
+        header = False
+
+
+def _write_jsonl(frames, out):
+    for df in frames:
+        if df.empty:
+            continue
+        text = df.to_json(orient="records", lines=True, date_format="iso", default_handler=str)
+        if not text.endswith("\n"):
+            text += "\n"
+        out.write(text.encode("utf-8"))
+
+
+def _write_parquet(frames, out):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for df in frames:
+            if df.empty:
+                continue
+            df = _flatten_nested(df)
+            if writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                # all-null columns in the first chunk would pin the type to null
+                schema = pa.schema(
+                    [f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema]
+                )
+                writer = pq.ParquetWriter(out, schema)
+            writer.write_table(pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _too_large(max_bytes):
+    return ExportTooLarge(
+        f"The export is larger than {max_bytes / 2**20:.0f} MB. "
+        "Narrow the date range or filters and try again."
+    )
+
+
+def _capped(frames, out, max_bytes):
+    # checked before each chunk is written, so an oversized export stops
+    # early instead of being written out in full first
+    for df in frames:
+        if out.tell() > max_bytes:
+            raise _too_large(max_bytes)
+        yield df
+
+
+def export_frames(frames, fmt="CSV", max_memory=8 * 1024 * 1024, max_bytes=None):
+    """
+    Write an iterable of DataFrame chunks in the given format and return a
+    readable binary file positioned at the start.
+
+    Only one chunk is materialized at a time and the output spills to a
+    temporary file past `max_memory` bytes, so memory stays bounded however
+    large the export is. With `max_bytes`, ExportTooLarge is raised as soon
+    as the output grows past it.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    out = tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b")
+    try:
+        if max_bytes is not None:
+            frames = _capped(frames, out, max_bytes)
+        if fmt == "CSV":
+            _write_csv(frames, out)
+        elif fmt == "JSONL":
+            _write_jsonl(frames, out)
+        else:
+            _write_parquet(frames, out)
+        if max_bytes is not None and out.tell() > max_bytes:
+            raise _too_large(max_bytes)
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+def export_bytes(frames, fmt="CSV", max_bytes=MAX_EXPORT_BYTES):
+    """
+    export_frames() read back as bytes, for st.download_button. Streamlit
+    keeps the download in memory whatever is passed to it, so the file is
+    only read back once it is known to fit in `max_bytes`.
+    """
+    with export_frames(frames, fmt, max_bytes=max_bytes) as f:
+        return f.read()
@@ -0,0 +1,338 @@
+import atexit
+import collections
+import concurrent.futures
+import csv
+import ipaddress
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+
+# Fields copied from a range file into the ipapi.co-shaped answer.
+GEO_FIELDS = (
+    "city", "region", "country_code", "country_name",
+    "latitude", "longitude", "timezone", "org",
+)
+FLOAT_FIELDS = ("latitude", "longitude")
+
+# Keep-alive connection pool shared by every lookup thread.
+_http = requests.Session()
+_http.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def lookup_ipapi(ip, timeout=5):
+    """
+    Geo lookup via ipapi.co. Raises on any failure so callers can tell a
+    real answer from a fallback.
+    """
+    r = _http.get(f"https://ipapi.co/{ip}/json/", timeout=timeout)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("error"):
+        raise ValueError(data.get("reason") or "ipapi.co lookup failed")
+    return data
+
+
+def ip_key(ip):
+    """
+    16-byte big-endian key; IPv4 is mapped into ::ffff:0:0/96 so both
+    families sort in one table.
+    """
+    addr = ipaddress.ip_address(ip)
+    if addr.version == 4:
+        addr = ipaddress.IPv6Address("::ffff:" + str(addr))
+    return addr.packed
+
+
+def _parse_bound(value):
+    value = value.strip()
+    if value.isdigit():
+        # integer exports (e.g. ip_from/ip_to); ip_address picks v4 below 2**32
+        return ipaddress.ip_address(int(value))
+    return ipaddress.ip_address(value)
+
+
+class RangeGeoResolver:
+    """
+    Offline IP -> geo resolver over a sorted table of address ranges.
+
+    `build()` compiles a CSV export once into .npy files; instances open them
+    with mmap so every Streamlit worker process shares one page-cached copy.
+    A lookup is one binary search over the range starts.
+
+    The CSV needs either a `network` column (CIDR) or `start_ip`/`end_ip`
+    columns (dotted or integer form), plus any of GEO_FIELDS.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.starts = np.load(os.path.join(data_dir, "starts.npy"), mmap_mode="r")
+        self.ends = np.load(os.path.join(data_dir, "ends.npy"), mmap_mode="r")
+        self.locations = np.load(os.path.join(data_dir, "locations.npy"), mmap_mode="r")
+        with open(os.path.join(data_dir, "places.json")) as f:
+            self.places = json.load(f)
+
+    @staticmethod
+    def build(csv_path, data_dir):
+        ranges = []
+        places = []
+        place_ids = {}
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for rec in csv.DictReader(f):
+                if rec.get("network"):
+                    net = ipaddress.ip_network(rec["network"].strip(), strict=False)
+                    first, last = net[0], net[-1]
+                else:
+                    first, last = _parse_bound(rec["start_ip"]), _parse_bound(rec["end_ip"])
+                place = {}
+                for k in GEO_FIELDS:
+                    v = rec.get(k)
+                    if v in (None, ""):
+                        continue
+                    place[k] = float(v) if k in FLOAT_FIELDS else v
+                key = json.dumps(place, sort_keys=True)
+                if key not in place_ids:
+                    place_ids[key] = len(places)
+                    places.append(place)
+                ranges.append((ip_key(str(first)), ip_key(str(last)), place_ids[key]))
+
+        ranges.sort()
+        os.makedirs(data_dir, exist_ok=True)
+        np.save(os.path.join(data_dir, "starts.npy"), np.array([r[0] for r in ranges], dtype="S16"))
+        np.save(os.path.join(data_dir, "ends.npy"), np.array([r[1] for r in ranges], dtype="S16"))
+        np.save(os.path.join(data_dir, "locations.npy"), np.array([r[2] for r in ranges], dtype=np.int32))
+        with open(os.path.join(data_dir, "places.json"), "w") as f:
+            json.dump(places, f)
+
+    @classmethod
+    def from_csv(cls, csv_path, data_dir=None):
+        """
+        Load the compiled table, rebuilding it first if the CSV is newer.
+        """
+        data_dir = data_dir or os.path.splitext(csv_path)[0] + "_ranges"
+        marker = os.path.join(data_dir, "places.json")
+        if not os.path.exists(marker) or os.path.getmtime(marker) < os.path.getmtime(csv_path):
+            cls.build(csv_path, data_dir)
+        return cls(data_dir)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def resolve(self, ip):
+        """
+        Geo dict for `ip`, or None when no range covers it.
+        """
+        try:
+            key = np.array(ip_key(ip), dtype="S16")
+        except ValueError:
+            return None
+        i = int(np.searchsorted(self.starts, key, side="right")) - 1
+        if i < 0 or key > self.ends[i]:
+            return None
+        return {"ip": ip, **self.places[int(self.locations[i])]}
+
+
+def make_lookup(resolver=None, fallback=lookup_ipapi):
+    """
+    Chain an offline resolver with an optional HTTP fallback for misses.
+    With `fallback=None` lookups never touch the network.
+    """
+    def lookup(ip):
+        if resolver is not None:
+            hit = resolver.resolve(ip)
+            if hit is not None:
+                return hit
+        if fallback is None:
+            raise LookupError(f"no geo range for {ip}")
+        return fallback(ip)
+    return lookup
+
+
+def lookup_from_env():
+    """
+    Lookup chain configured by GEO_RANGES_CSV (offline range file) and
+    GEO_HTTP_FALLBACK ("0" disables ipapi.co for misses).
+    """
+    path = os.environ.get("GEO_RANGES_CSV")
+    resolver = RangeGeoResolver.from_csv(path) if path and os.path.exists(path) else None
+    fallback = lookup_ipapi if os.environ.get("GEO_HTTP_FALLBACK", "1") != "0" else None
+    return make_lookup(resolver, fallback)
+
+
+class GeoCache:
+    """
+    Bounded LRU cache of geo lookups keyed by IP, shared across sessions.
+
+    Successful answers live for `ttl` seconds. Failures are cached as
+    {"ip": ip} for `negative_ttl` seconds so a flaky geo API is not hit
+    again on every click from the same visitor.
+    """
+
+    def __init__(self, lookup=lookup_ipapi, maxsize=10000, ttl=86400, negative_ttl=300):
+        self.lookup = lookup
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def _cached(self, ip):
+        # caller holds self._lock
+        entry = self._data.get(ip)
+        if entry is None:
+            return None
+        expires, ok, value = entry
+        if expires <= time.monotonic():
+            del self._data[ip]
+            return None
+        self._data.move_to_end(ip)
+        if ok:
+            self.hits += 1
+        else:
+            self.negative_hits += 1
+        return dict(value)
+
+    def peek(self, ip):
+        """
+        Cached answer for `ip`, or None on a miss. Never does a lookup.
+        """
+        if not ip:
+            return {}
+        with self._lock:
+            return self._cached(ip)
+
+    def get(self, ip):
+        if not ip:
+            return {}
+        with self._lock:
+            value = self._cached(ip)
+            if value is not None:
+                return value
+            # only one thread looks up a given IP; the others wait for it
+            pending = self._inflight.get(ip)
+            if pending is None:
+                self.misses += 1
+                self._inflight[ip] = threading.Event()
+        if pending is not None:
+            pending.wait(30)
+            with self._lock:
+                value = self._cached(ip)
+            return value if value is not None else {"ip": ip}
+
+        try:
+            value, ok = self.lookup(ip), True
+        except Exception:
+            value, ok = {"ip": ip}, False
+        self.put(ip, value, ok)
+        with self._lock:
+            self._inflight.pop(ip).set()
+        return dict(value)
+
+    def put(self, ip, value, ok=True):
+        expires = time.monotonic() + (self.ttl if ok else self.negative_ttl)
+        with self._lock:
+            if not ok:
+                self.failures += 1
+            self._data[ip] = (expires, ok, value)
+            self._data.move_to_end(ip)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.negative_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+class GeoEnricher:
+    """
+    Resolve geo for events off the request path without holding the events.
+
+    `resolve(ip)` never blocks: it returns the cached answer, or {"ip": ip}
+    and queues one background lookup for that IP into the shared cache (at
+    most one per IP and `max_pending` overall; past that the miss is only
+    counted). `submit(ip, make_row)` hands the row to `sink` at once with
+    whatever resolve() returned, so events are recorded immediately, in
+    click order, and survive a geo API outage. Rows that went out with only
+    the IP get their geo from the cache when they are read back (see
+    event_store.fill_geo).
+    """
+
+    def __init__(self, cache, sink=None, workers=4, max_pending=1000):
+        self.cache = cache
+        self.sink = sink
+        self.max_pending = max_pending
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="geo-enrich"
+        )
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.inline = 0
+        self.deferred = 0
+        self.dropped = 0
+        atexit.register(self.close)
+
+    def resolve(self, ip):
+        if not ip:
+            return {}
+        geo = self.cache.peek(ip)
+        with self._lock:
+            if geo is not None:
+                self.inline += 1
+                return geo
+            self.deferred += 1
+            if ip in self._pending:
+                return {"ip": ip}
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return {"ip": ip}
+            self._pending.add(ip)
+        self._pool.submit(self._lookup, ip)
+        return {"ip": ip}
+
+    def submit(self, ip, make_row):
+        self.sink(make_row(self.resolve(ip)))
+
+    def _lookup(self, ip):
+        try:
+            self.cache.get(ip)
+        finally:
+            with self._lock:
+                self._pending.discard(ip)
+
+    def close(self):
+        """
+        Finish outstanding lookups so their answers reach the cache.
+        """
+        self._pool.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "inline": self.inline,
+                "deferred": self.deferred,
+                "dropped": self.dropped,
+            }
@@ -0,0 +1,201 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+
+class ModelRegistry:
+    """
+    Versioned model artifacts on local disk.
+
+    Each version lives in <root>/<name>/v<N>/ as `model.npz` (a dict of
+    numpy arrays) or `model.joblib` (any picklable object) plus
+    `metadata.json`. A version directory is fully written before it is
+    renamed into place, and the CURRENT file naming the live version is
+    replaced atomically, so readers never see a half-written model.
+    """
+
+    def __init__(self, root="models", keep=5):
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, name):
+        return os.path.join(self.root, name)
+
+    def versions(self, name):
+        try:
+            entries = os.listdir(self._dir(name))
+        except OSError:
+            return []
+        return sorted(int(e[1:]) for e in entries if e.startswith("v") and e[1:].isdigit())
+
+    def current(self, name):
+        """
+        Live version number, or None if nothing was published yet.
+        """
+        try:
+            with open(os.path.join(self._dir(name), "CURRENT")) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def publish(self, name, artifact, fmt="npz", metadata=None):
+        """
+        Write `artifact` as a new version, make it current and return its
+        version number.
+        """
+        base = self._dir(name)
+        os.makedirs(base, exist_ok=True)
+        tmp = os.path.join(base, f"_tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            if fmt == "npz":
+                np.savez(os.path.join(tmp, "model.npz"), **artifact)
+            elif fmt == "joblib":
+                import joblib
+
+                joblib.dump(artifact, os.path.join(tmp, "model.joblib"))
+            else:
+                raise ValueError(f"unknown model format {fmt!r}")
+            meta = dict(metadata or {}, name=name, format=fmt, created_at=time.time())
+            existing = self.versions(name)
+            version = (existing[-1] if existing else 0) + 1
+            meta["version"] = version
+            with open(os.path.join(tmp, "metadata.json"), "w") as f:
+                json.dump(meta, f)
+            os.rename(tmp, os.path.join(base, f"v{version}"))
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        pointer = os.path.join(base, "CURRENT.tmp")
+        with open(pointer, "w") as f:
+            f.write(str(version))
+        os.replace(pointer, os.path.join(base, "CURRENT"))
+        self._prune(name, version)
+        return version
+
+    def _prune(self, name, current):
+        for v in self.versions(name)[:-self.keep]:
+            if v != current:
+                shutil.rmtree(os.path.join(self._dir(name), f"v{v}"), ignore_errors=True)
+
+    def metadata(self, name, version=None):
+        version = version if version is not None else self.current(name)
+        if version is None:
+            return None
+        with open(os.path.join(self._dir(name), f"v{version}", "metadata.json")) as f:
+            return json.load(f)
+
+    def load(self, name, version=None):
+        """
+        (artifact, metadata) of `version` (default: current). npz artifacts
+        come back as a dict of arrays.
+        """
+        meta = self.metadata(name, version)
+        if meta is None:
+            return None, None
+        path = os.path.join(self._dir(name), f"v{meta['version']}")
+        if meta["format"] == "npz":
+            with np.load(os.path.join(path, "model.npz"), allow_pickle=False) as data:
+                artifact = {k: data[k] for k in data.files}
+        else:
+            import joblib
+
+            artifact = joblib.load(os.path.join(path, "model.joblib"))
+        return artifact, meta
+
+
+class SharedModelCache:
+    """
+    Process-wide read-only view of a ModelRegistry.
+
+    Every session calling `get()` shares one loaded copy per model. The
+    CURRENT pointer is re-checked at most every `check_interval` seconds
+    and a new version is loaded once, then swapped in whole. `decode`
+    maps a raw artifact to the object callers use.
+
+    `get_or_train()` retrains only when the training input changed (as
+    told by `fingerprint`), and concurrent callers wait for a single
+    training run instead of repeating it.
+    """
+
+    def __init__(self, registry, decode=None, check_interval=5.0):
+        self.registry = registry
+        self.decode = decode or {}
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._train_locks = {}
+        self._loaded = {}  # name -> (version, model, metadata, checked_at)
+        self.loads = 0
+        self.trainings = 0
+
+    def _decode(self, name, artifact):
+        fn = self.decode.get(name)
+        return fn(artifact) if fn else artifact
+
+    def _entry(self, name):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None and now - entry[3] < self.check_interval:
+                return entry
+        version = self.registry.current(name)
+        if entry is not None and entry[0] == version:
+            entry = (entry[0], entry[1], entry[2], now)
+        elif version is None:
+            entry = (None, None, None, now)
+        else:
+            artifact, meta = self.registry.load(name, version)
+            entry = (version, self._decode(name, artifact), meta, now)
+            self.loads += 1
+        with self._lock:
+            self._loaded[name] = entry
+        return entry
+
+    def get(self, name):
+        """
+        Current model for `name`, or None if none was published.
+        """
+        return self._entry(name)[1]
+
+    def metadata(self, name):
+        return self._entry(name)[2]
+
+    def publish(self, name, artifact, fmt="npz", metadata=None):
+        version = self.registry.publish(name, artifact, fmt, metadata)
+        meta = self.registry.metadata(name, version)
+        with self._lock:
+            self._loaded[name] = (version, self._decode(name, artifact), meta, time.monotonic())
+        return version
+
+    def get_or_train(self, name, fingerprint, train, fmt="npz"):
+        """
+        Return the current model if it was trained on `fingerprint`;
+        otherwise call `train()` (which returns an artifact or None),
+        publish the result and return it.
+        """
+        with self._lock:
+            lock = self._train_locks.setdefault(name, threading.Lock())
+        with lock:
+            meta = self.metadata(name)
+            if meta is not None and meta.get("fingerprint") == fingerprint:
+                return self.get(name)
+            artifact = train()
+            if artifact is None:
+                return self.get(name)
+            self.trainings += 1
+            self.publish(name, artifact, fmt, {"fingerprint": fingerprint})
+            return self.get(name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": {n: e[0] for n, e in self._loaded.items()},
+                "loads": self.loads,
+                "trainings": self.trainings,
+            }
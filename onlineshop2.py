@@ -4,7 +4,13 @@ import pandas as pd
 import numpy as np
 import requests
 import json
+import os
+from bson import ObjectId
 from pymongo import MongoClient
+from event_spool import EventSpool, SpoolReplayer
+from event_writer import MongoEventWriter, insert_documents
+from exporter import EXPORT_FORMATS, export_bytes, iter_cursor_frames
+from geo import GeoCache, GeoEnricher, lookup_from_env
 
 st.set_page_config(page_title="E-Commerce App", layout="wide")
 
@@ -20,7 +26,18 @@ def get_mongo():
     client.admin.command("ping")
     return client["ecommerce_db"]
 
+@st.cache_resource
+def ensure_indexes():
+    # supports the dashboard's $match/$group stages and time-range queries
+    db = get_mongo()
+    db["events"].create_index("timestamp")
+    db["events"].create_index([("action", 1), ("product_name", 1)])
+    db["events"].create_index("product_name")
+    db["orders"].create_index("timestamp")
+    return True
+
 db = get_mongo()
+ensure_indexes()
 events_col = db["events"]
 orders_col = db["orders"]
 
@@ -55,44 +72,124 @@ PRODUCTS = [
 # =========================
 # LOG EVENT (MongoDB)
 # =========================
-def log_event(user, pid, pname, action, extra=None):
-    events_col.insert_one({
+# not the Sheets apps' EVENT_SPOOL_PATH: this spool holds dicts, theirs rows
+SPOOL_PATH = os.environ.get("MONGO_EVENT_SPOOL_PATH", "mongo_event_spool.db")
+# exports larger than this are refused instead of being held in memory
+EXPORT_MAX_BYTES = int(os.environ.get("EXPORT_MAX_MB", 200)) * 1024 * 1024
+
+def restore_event(doc):
+    # the spool stores JSON, so ids and timestamps come back as strings.
+    # insert_many set the _id before the write failed; keeping it makes a
+    # replay of an already stored event a duplicate-key error, not a copy
+    doc = dict(doc)
+    if isinstance(doc.get("_id"), str):
+        doc["_id"] = ObjectId(doc["_id"])
+    if isinstance(doc.get("timestamp"), str):
+        doc["timestamp"] = datetime.datetime.fromisoformat(doc["timestamp"])
+    return doc
+
+@st.cache_resource
+def get_event_spool():
+    """
+    On-disk spool for events Mongo rejected, shared by all sessions and
+    replayed into events_col in batches once Mongo is reachable again.
+    """
+    spool = EventSpool(SPOOL_PATH)
+    col = get_mongo()["events"]
+    SpoolReplayer(
+        spool,
+        lambda docs: insert_documents(col, [restore_event(d) for d in docs]),
+    )
+    return spool
+
+@st.cache_resource
+def get_event_writer():
+    """
+    Buffered insert_many writer for events_col, shared by all sessions.
+    EVENTS_WRITE_CONCERN=0 makes telemetry writes unacknowledged.
+    """
+    spool = get_event_spool()
+    w = os.environ.get("EVENTS_WRITE_CONCERN")
+    return MongoEventWriter(
+        get_mongo()["events"],
+        w=int(w) if w else None,
+        max_batch=200,
+        flush_interval=1.0,
+        on_error=lambda docs, exc: spool.append(docs),
+    )
+
+def make_event(user, pid, pname, action, extra=None):
+    return {
         "timestamp": datetime.datetime.utcnow(),
         "user": user,
         "product_id": pid,
         "product_name": pname,
         "action": action,
         "extra": extra or {}
-    })
+    }
+
+def log_event(user, pid, pname, action, extra=None):
+    get_event_writer().submit(make_event(user, pid, pname, action, extra))
 
 # =========================
-# IP & GEO
+# ANALYTICS (server-side aggregation)
 # =========================
+def order_kpis():
+    res = list(orders_col.aggregate([
+        {"$group": {"_id": None, "orders": {"$sum": 1}, "revenue": {"$sum": "$total"}}}
+    ]))
+    return (res[0]["orders"], res[0]["revenue"]) if res else (0, 0)
+
+def daily_order_counts():
+    res = orders_col.aggregate([
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+            "orders": {"$sum": 1},
+        }},
+        {"$sort": {"_id": 1}},
+    ])
+    return pd.Series({pd.to_datetime(r["_id"]).date(): r["orders"] for r in res}, dtype="int64")
+
+def top_selling_products(limit=20):
+    res = orders_col.aggregate([
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.name",
+            "quantity": {"$sum": "$items.qty"},
+        }},
+        {"$sort": {"quantity": -1}},
+        {"$limit": limit},
+    ])
+    return pd.Series({r["_id"]: r["quantity"] for r in res}, dtype="int64")
+
+def event_counts(field, match=None, limit=None):
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return pd.Series({r["_id"]: r["count"] for r in events_col.aggregate(pipeline)}, dtype="int64")
+
 def analytics_dashboard():
     st.header("📊 E-Commerce Analytics Dashboard")
 
     # ---------------------------
-    # Load Data from MongoDB
+    # Aggregate in MongoDB; only the small result sets come back
     # ---------------------------
-    orders = list(orders_col.find({}, {"_id": 0}))
-    events = list(events_col.find({}, {"_id": 0}))
+    total_orders, total_revenue = order_kpis()
+    total_events = events_col.estimated_document_count()
 
-    if not orders and not events:
+    if not total_orders and not total_events:
         st.warning("No data available yet")
         return
 
-    orders_df = pd.DataFrame(orders) if orders else pd.DataFrame()
-    events_df = pd.DataFrame(events) if events else pd.DataFrame()
-
     # ---------------------------
     # KPI METRICS
     # ---------------------------
     st.subheader("🔑 Key Performance Indicators")
 
-    total_orders = len(orders_df)
-    total_revenue = orders_df["total"].sum() if not orders_df.empty else 0
-    total_events = len(events_df)
-
     col1, col2, col3 = st.columns(3)
     col1.metric("Total Orders", total_orders)
     col2.metric("Total Revenue (₹)", int(total_revenue))
@@ -103,64 +200,89 @@ def analytics_dashboard():
     # ---------------------------
     # ORDERS OVER TIME
     # ---------------------------
-    if not orders_df.empty:
+    if total_orders:
         st.subheader("📈 Orders Over Time")
-        orders_df["date"] = pd.to_datetime(orders_df["timestamp"]).dt.date
-        daily_orders = orders_df.groupby("date").size()
-        st.line_chart(daily_orders)
+        st.line_chart(daily_order_counts())
 
     # ---------------------------
     # TOP SELLING PRODUCTS
     # ---------------------------
-    if not orders_df.empty:
+    if total_orders:
         st.subheader("🏆 Top Selling Products")
-
-        product_sales = []
-        for _, row in orders_df.iterrows():
-            for item in row["items"]:
-                product_sales.append({
-                    "product": item["name"],
-                    "quantity": item["qty"],
-                    "revenue": item["price"] * item["qty"]
-                })
-
-        sales_df = pd.DataFrame(product_sales)
-        top_products = sales_df.groupby("product")["quantity"].sum().sort_values(ascending=False)
-
-        st.bar_chart(top_products)
+        st.bar_chart(top_selling_products())
 
     # ---------------------------
     # MOST VIEWED PRODUCTS
     # ---------------------------
-    if not events_df.empty:
+    if total_events:
         st.subheader("👀 Most Viewed Products")
 
-        views_df = events_df[events_df["action"] == "view"]
-        if not views_df.empty:
-            view_counts = views_df["product_name"].value_counts()
+        view_counts = event_counts("product_name", match={"action": "view"})
+        if not view_counts.empty:
             st.bar_chart(view_counts)
 
     # ---------------------------
     # USER ACTIVITY DISTRIBUTION
     # ---------------------------
-    if not events_df.empty:
+    if total_events:
         st.subheader("🧭 User Activity Distribution")
-        activity_counts = events_df["action"].value_counts()
-        st.bar_chart(activity_counts)
-
+        st.bar_chart(event_counts("action"))
 
+    # ---------------------------
+    # EXPORT EVENTS
+    # ---------------------------
+    if total_events:
+        st.subheader("📤 Export Events")
+        export_fmt = st.selectbox("Format", list(EXPORT_FORMATS), key="events_export_fmt")
+        ext, mime = EXPORT_FORMATS[export_fmt]
+
+        def export_data():
+            # streamed from a cursor in batches; runs only when clicked
+            cursor = events_col.find({}, {"_id": 0}, batch_size=5000).sort("timestamp", 1)
+            return export_bytes(iter_cursor_frames(cursor), export_fmt, max_bytes=EXPORT_MAX_BYTES)
+
+        st.download_button(
+            f"Download {export_fmt} of all events",
+            export_data,
+            file_name=f"events.{ext}",
+            mime=mime,
+        )
+        st.caption(f"Exports are limited to {EXPORT_MAX_BYTES // 2**20} MB.")
 
+# =========================
+# IP & GEO
+# =========================
 def get_client_ip():
     try:
         return requests.get("https://api.ipify.org?format=json", timeout=5).json()["ip"]
     except Exception:
         return None
 
+@st.cache_resource
+def get_geo_cache():
+    """
+    IP -> geo answers shared by all sessions, so a returning visitor
+    never costs another ipapi.co round trip. Resolved from the offline
+    range file first when GEO_RANGES_CSV is set.
+    """
+    return GeoCache(
+        lookup=lookup_from_env(),
+        maxsize=int(os.environ.get("GEO_CACHE_SIZE", 10000)),
+        ttl=int(os.environ.get("GEO_CACHE_TTL", 86400)),
+        negative_ttl=int(os.environ.get("GEO_CACHE_NEGATIVE_TTL", 300)),
+    )
+
+@st.cache_resource
+def get_geo_enricher():
+    """
+    Background lookups into the geo cache, so a click never waits on
+    ipapi.co.
+    """
+    return GeoEnricher(get_geo_cache(), workers=4)
+
 def get_geo(ip):
-    try:
-        return requests.get(f"https://ipapi.co/{ip}/json/", timeout=5).json()
-    except Exception:
-        return {}
+    # cached answer, or just the IP while the lookup runs in the background
+    return get_geo_enricher().resolve(ip)
 
 if st.session_state.client_ip is None:
     st.session_state.client_ip = get_client_ip()
@@ -212,15 +334,19 @@ def checkout():
 
     address = st.text_area("Address")
     if st.button("Place Order"):
-        orders_col.insert_one({
-            "user": st.session_state.user or "guest",
+        user = st.session_state.user or "guest"
+        order = orders_col.insert_one({
+            "user": user,
             "items": st.session_state.cart,
             "total": sum(i["price"] * i["qty"] for i in st.session_state.cart),
             "address": address,
             "timestamp": datetime.datetime.utcnow()
         })
-        for i in st.session_state.cart:
-            log_event(st.session_state.user or "guest", i["id"], i["name"], "order")
+        # all per-item order events go out together in one insert_many
+        get_event_writer().submit_many(
+            make_event(user, i["id"], i["name"], "order", {"order_id": str(order.inserted_id)})
+            for i in st.session_state.cart
+        )
         st.session_state.cart = []
         st.success("Order placed successfully")
 
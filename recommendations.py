@@ -0,0 +1,139 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+
+class RecommendationTable:
+    """
+    Precomputed top-N product lists per user plus a popularity fallback.
+
+    Tables are immutable once built; `lookup()` is a dict access, so the
+    product page never scores or sorts anything per request.
+    """
+
+    def __init__(self, by_user=None, popular=(), built_at=None):
+        self.by_user = dict(by_user or {})
+        self.popular = tuple(popular)
+        self.built_at = built_at
+
+    def __len__(self):
+        return len(self.by_user)
+
+    def lookup(self, user, topn=None):
+        recs = self.by_user.get(user, self.popular) if user else self.popular
+        return list(recs[:topn] if topn else recs)
+
+    @classmethod
+    def from_views(cls, views, topn=5, count=None, exclude=("guest",)):
+        """
+        Build from view events with `user` and `product_name` columns (and
+        an optional pre-aggregated `count` column): each user's most viewed
+        products first, topped up with the most viewed overall.
+        """
+        views = views.dropna(subset=["user", "product_name"])
+        if count is None:
+            counts = views.groupby(["user", "product_name"]).size().reset_index(name="n")
+        else:
+            counts = views.groupby(["user", "product_name"])[count].sum().reset_index(name="n")
+        popularity = counts.groupby("product_name")["n"].sum().sort_values(ascending=False, kind="stable")
+        popular = tuple(popularity.index[:topn])
+
+        counts = counts[~counts["user"].isin(exclude)]
+        counts["rank"] = counts["product_name"].map({p: i for i, p in enumerate(popularity.index)})
+        # ties on a user's own count go to the more popular product
+        top = (
+            counts.sort_values(["user", "n", "rank"], ascending=[True, False, True])
+            .groupby("user", sort=False)
+            .head(topn)
+        )
+        by_user = {}
+        for user, products in top.groupby("user", sort=False)["product_name"]:
+            recs = list(products)
+            if len(recs) < topn:
+                recs += [p for p in popular if p not in recs][:topn - len(recs)]
+            by_user[user] = tuple(recs)
+        return cls(by_user, popular, time.time())
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "built_at": self.built_at,
+                "popular": list(self.popular),
+                "by_user": {u: list(r) for u, r in self.by_user.items()},
+            }, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        by_user = {u: tuple(r) for u, r in data.get("by_user", {}).items()}
+        return cls(by_user, data.get("popular", ()), data.get("built_at"))
+
+
+class TableRefresher:
+    """
+    Background thread that rebuilds a RecommendationTable every `interval`
+    seconds with `build()` and swaps it in whole.
+
+    The last table saved to `path` is served until the first rebuild
+    finishes, so restarts do not start cold. A failing build keeps the
+    previous table and is reported through `last_error`.
+    """
+
+    def __init__(self, build, path=None, interval=600.0):
+        self.build = build
+        self.path = path
+        self.interval = interval
+        self.table = RecommendationTable.load(path) if path else RecommendationTable()
+        self.builds = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="recs-refresher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def lookup(self, user, topn=None):
+        return self.table.lookup(user, topn)
+
+    def refresh(self):
+        """
+        Rebuild now; raises whatever `build()` raised.
+        """
+        with self._lock:
+            table = self.build()
+            self.table = table
+            self.builds += 1
+            if self.path:
+                table.save(self.path)
+            return table
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        delay = 0
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = repr(e)
+
+    def stats(self):
+        table = self.table
+        return {
+            "users": len(table),
+            "builds": self.builds,
+            "built_at": table.built_at,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,437 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class CSRMatrix:
+    """
+    Minimal compressed-sparse-row matrix over flat numpy arrays.
+
+    Row i's non-zeros are data[indptr[i]:indptr[i + 1]] at the columns in
+    indices[indptr[i]:indptr[i + 1]]. Only the products the recommender
+    needs are implemented, so memory is O(non-zeros) instead of
+    O(rows x vocabulary).
+    """
+
+    def __init__(self, data, indices, indptr, shape, dtype=np.float64):
+        self.data = np.asarray(data, dtype=dtype)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.shape = (int(shape[0]), int(shape[1]))
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def _row_ids(self):
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def dot(self, w):
+        """
+        X @ w for a vector (n_cols,) or matrix (n_cols, k).
+        """
+        w = np.asarray(w)
+        vals = self.data.reshape((-1,) + (1,) * (w.ndim - 1)) * w[self.indices]
+        out = np.zeros((self.shape[0],) + w.shape[1:], dtype=vals.dtype)
+        nonempty = np.diff(self.indptr) > 0
+        if nonempty.any():
+            out[nonempty] = np.add.reduceat(vals, self.indptr[:-1][nonempty], axis=0)
+        return out
+
+    def tdot(self, v):
+        """
+        X.T @ v for a vector (n_rows,) or matrix (n_rows, k).
+        """
+        v = np.asarray(v)
+        out = np.zeros((self.shape[1],) + v.shape[1:], dtype=np.result_type(self.data, v))
+        if not self.nnz:
+            return out
+        # group entries by column, then sum each column's run in one reduceat
+        order = np.argsort(self.indices, kind="stable")
+        cols = self.indices[order]
+        vals = self.data[order].reshape((-1,) + (1,) * (v.ndim - 1)) * v[self._row_ids()[order]]
+        starts = np.flatnonzero(np.concatenate([[True], cols[1:] != cols[:-1]]))
+        out[cols[starts]] = np.add.reduceat(vals, starts, axis=0)
+        return out
+
+    def take_rows(self, rows):
+        """
+        New matrix made of the given rows, in that order.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = np.diff(self.indptr)[rows]
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        # position of every kept entry in the original data/indices arrays
+        pos = np.repeat(self.indptr[rows] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return CSRMatrix(self.data[pos], self.indices[pos], indptr, (len(rows), self.shape[1]), self.data.dtype)
+
+    def astype(self, dtype):
+        return CSRMatrix(self.data, self.indices, self.indptr, self.shape, dtype)
+
+    def resize(self, n_cols):
+        """
+        Same rows with `n_cols` columns; entries past the new width are dropped.
+        """
+        if n_cols >= self.shape[1]:
+            return CSRMatrix(self.data, self.indices, self.indptr, (self.shape[0], n_cols), self.data.dtype)
+        keep = self.indices < n_cols
+        counts = np.bincount(self._row_ids()[keep], minlength=self.shape[0])
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        return CSRMatrix(self.data[keep], self.indices[keep], indptr, (self.shape[0], n_cols), self.data.dtype)
+
+    def toarray(self):
+        out = np.zeros(self.shape)
+        np.add.at(out, (self._row_ids(), self.indices), self.data)
+        return out
+
+
+class Vocabulary:
+    """
+    Word -> column index map that only ever grows, so columns keep their
+    meaning across encodes, retrains and (via save/load) restarts.
+    """
+
+    def __init__(self, words=()):
+        self.index = {}
+        self._lock = threading.Lock()
+        for w in words:
+            self.index.setdefault(w, len(self.index))
+
+    def __len__(self):
+        return len(self.index)
+
+    def encode(self, texts, grow=True):
+        """
+        Bag-of-words counts of lower-cased, whitespace-split `texts` as a
+        CSRMatrix. Unknown words get new columns when `grow` is set and are
+        dropped otherwise.
+        """
+        tokens = [t.lower().split() if isinstance(t, str) else [] for t in texts]
+        lengths = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+        flat = [w for t in tokens for w in t]
+        codes, uniques = pd.factorize(pd.Series(flat, dtype=object))
+        # only the distinct words of this batch touch the dict
+        with self._lock:
+            if grow:
+                for w in uniques:
+                    self.index.setdefault(w, len(self.index))
+            ids = np.array([self.index.get(w, -1) for w in uniques], dtype=np.int64)
+            width = len(self.index)
+        cols = ids[codes] if len(flat) else np.zeros(0, dtype=np.int64)
+        rows = np.repeat(np.arange(len(tokens)), lengths)
+        known = cols >= 0
+        rows, cols = rows[known], cols[known]
+        # merge repeated words within a row into counts; keys come out sorted
+        keys, counts = np.unique(rows * max(width, 1) + cols, return_counts=True)
+        rows, cols = np.divmod(keys, max(width, 1))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(tokens)))])
+        return CSRMatrix(counts, cols, indptr, (len(tokens), width))
+
+    def words(self):
+        with self._lock:
+            return sorted(self.index, key=self.index.get)
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.words(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return cls()
+
+
+def encode_texts(texts, vocab=None):
+    """
+    Sparse bag-of-words encoding of `texts`; returns (CSRMatrix, vocab).
+    """
+    vocab = vocab if vocab is not None else Vocabulary()
+    return vocab.encode(texts), vocab
+
+
+def _softmax(logits):
+    z = logits - logits.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=1, keepdims=True)
+    return z
+
+
+def train_softmax(X, y, n_classes, W=None, b=None, lr=0.5, l2=1e-4, tol=1e-4,
+                  max_epochs=100, patience=2, batch_size=None, dtype=np.float64, seed=0,
+                  accumulators=None):
+    """
+    Multinomial logistic regression on a CSRMatrix by Adagrad descent.
+
+    Starts from W (n_features, n_classes) and b when given. With
+    `batch_size` each epoch is a shuffled pass of mini-batch steps,
+    otherwise one full-batch step. Training stops once the epoch's mean
+    cross-entropy improved by less than `tol` (relative) for `patience`
+    epochs in a row. `accumulators`, a (hW, hb) pair shaped like W and b,
+    carries Adagrad's squared-gradient sums across calls and is updated in
+    place, so a warm start keeps the step sizes earlier training reached.
+    Returns (W, b, info).
+    """
+    n, d = X.shape
+    X = X.astype(dtype)
+    W = np.zeros((d, n_classes), dtype=dtype) if W is None else W.astype(dtype, copy=True)
+    b = np.zeros(n_classes, dtype=dtype) if b is None else b.astype(dtype, copy=True)
+    y = np.asarray(y, dtype=np.int64)
+    hW, hb = accumulators if accumulators is not None else (np.zeros_like(W), np.zeros_like(b))
+    rng = np.random.default_rng(seed)
+    step = batch_size if batch_size and batch_size < n else n
+    best = np.inf
+    stalled = 0
+    loss = np.nan
+    epoch = 0
+    for epoch in range(1, max_epochs + 1):
+        order = rng.permutation(n) if step < n else None
+        total = 0.0
+        for start in range(0, n, step):
+            if order is None:
+                Xb, yb = X, y
+            else:
+                idx = order[start:start + step]
+                Xb, yb = X.take_rows(idx), y[idx]
+            P = _softmax(Xb.dot(W) + b)
+            m = len(yb)
+            total += -np.log(P[np.arange(m), yb] + 1e-12).sum()
+            # dL/dlogits for mean cross-entropy is (P - onehot) / m
+            P[np.arange(m), yb] -= 1
+            P /= m
+            gW = Xb.tdot(P) + l2 * W
+            gb = P.sum(axis=0)
+            # Adagrad: rarely seen tokens (most user names) keep large steps
+            hW += gW * gW
+            hb += gb * gb
+            W -= lr * gW / (np.sqrt(hW) + 1e-8)
+            b -= lr * gb / (np.sqrt(hb) + 1e-8)
+        loss = total / max(n, 1)
+        if np.isfinite(best) and best - loss < tol * best:
+            stalled += 1
+            if stalled >= patience:
+                break
+        else:
+            stalled = 0
+        best = min(best, loss)
+    return W, b, {"epochs": epoch, "loss": float(loss)}
+
+
+class OnlineRecommender:
+    """
+    Warm-started softmax view model that is trained only on events it has
+    not seen yet and persisted under `state_dir`.
+
+    `apply()` (an EventStore listener, or called with the full event frame
+    and reset=True) buffers new view events past the persisted high-water
+    mark; `train_pending()` fits them with train_softmax(), starting from
+    the current weights. Features are the tokens of the user name, the same
+    ones recommend() sees, and there is one output per product. New words
+    and products add rows and columns to W, so earlier training is kept
+    and each update costs O(new events).
+
+    The first fit runs up to `max_epochs`; later ones make `update_epochs`
+    passes over the new rows only. The Adagrad sums are kept (and saved)
+    with the weights, so a handful of new events takes small steps on
+    well-trained parameters instead of overwriting them.
+    """
+
+    def __init__(self, state_dir=None, lr=0.5, l2=1e-4, tol=1e-4, max_epochs=50,
+                 patience=2, batch_size=2048, dtype="float64", update_epochs=1):
+        self.state_dir = state_dir
+        self.lr = lr
+        self.l2 = l2
+        self.tol = tol
+        self.max_epochs = max_epochs
+        self.patience = patience
+        self.batch_size = batch_size
+        self.update_epochs = update_epochs
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+        self._pending = []
+        self._seen = 0
+        self._buffered = 0
+        self.vocab = Vocabulary()
+        self.W = np.zeros((0, 0), dtype=self.dtype)
+        self.b = np.zeros(0, dtype=self.dtype)
+        self.hW = np.zeros((0, 0), dtype=self.dtype)  # Adagrad sums for W and b
+        self.hb = np.zeros(0, dtype=self.dtype)
+        self.classes = []
+        self._class_ids = {}
+        self.rows_trained = 0
+        self.views_trained = 0
+        self.last_fit = None
+        if state_dir:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.state_dir, "state.json")) as f:
+                state = json.load(f)
+            W = np.load(os.path.join(self.state_dir, "weights.npy"))
+            b = np.load(os.path.join(self.state_dir, "bias.npy"))
+        except (OSError, ValueError):
+            return
+        if W.ndim != 2 or W.shape[1] != len(b):
+            # state from the old single-vector model: retrain from scratch
+            return
+        self.vocab = Vocabulary.load(os.path.join(self.state_dir, "vocab.json"))
+        self.W = W.astype(self.dtype)
+        self.b = b.astype(self.dtype)
+        try:
+            hW = np.load(os.path.join(self.state_dir, "adagrad_weights.npy"))
+            hb = np.load(os.path.join(self.state_dir, "adagrad_bias.npy"))
+        except (OSError, ValueError):
+            hW = hb = None
+        if hW is None or hW.shape != W.shape or hb.shape != b.shape:
+            # saved before the sums were kept: restart them
+            hW, hb = np.zeros_like(W), np.zeros_like(b)
+        self.hW = hW.astype(self.dtype)
+        self.hb = hb.astype(self.dtype)
+        self.classes = list(state.get("classes", []))
+        self._class_ids = {c: i for i, c in enumerate(self.classes)}
+        self.rows_trained = int(state.get("rows_trained", 0))
+        self.views_trained = int(state.get("views_trained", 0))
+
+    def save(self):
+        if not self.state_dir:
+            return
+        with self._lock:
+            os.makedirs(self.state_dir, exist_ok=True)
+            arrays = (("weights", self.W), ("bias", self.b),
+                      ("adagrad_weights", self.hW), ("adagrad_bias", self.hb))
+            for name, arr in arrays:
+                tmp = os.path.join(self.state_dir, f"{name}.tmp.npy")
+                np.save(tmp, arr)
+                os.replace(tmp, os.path.join(self.state_dir, f"{name}.npy"))
+            self.vocab.save(os.path.join(self.state_dir, "vocab.json"))
+            # state.json goes last: it is what marks the rows as trained
+            tmp = os.path.join(self.state_dir, "state.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump({
+                    "classes": self.classes,
+                    "rows_trained": self.rows_trained,
+                    "views_trained": self.views_trained,
+                }, f)
+            os.replace(tmp, os.path.join(self.state_dir, "state.json"))
+
+    def apply(self, new_rows, reset=False):
+        """
+        Buffer view events from `new_rows` that were not trained on yet.
+        """
+        with self._lock:
+            if reset:
+                self._seen = 0
+                self._pending = []
+                self._buffered = 0
+            if new_rows is None or new_rows.empty:
+                return
+            skip = max(0, self.rows_trained - self._seen)
+            self._seen += len(new_rows)
+            if skip < len(new_rows):
+                rows = new_rows.iloc[skip:]
+                views = rows[rows["action"] == "view"]
+                if not views.empty:
+                    self._pending.append(views[["user", "product_name"]])
+                self._buffered = self._seen
+
+    def _label_ids(self, labels):
+        for c in labels:
+            if c not in self._class_ids:
+                self._class_ids[c] = len(self.classes)
+                self.classes.append(c)
+        return np.array([self._class_ids[c] for c in labels], dtype=np.int64)
+
+    def partial_fit(self, texts, labels):
+        """
+        Fit `texts` -> `labels` starting from the current weights.
+        """
+        with self._lock:
+            X = self.vocab.encode(texts)
+            y = self._label_ids(labels)
+            d, k = X.shape[1], len(self.classes)
+            first = self.W.size == 0
+            if self.W.shape != (d, k):
+                self.W, self.hW = self._grow(self.W, (d, k)), self._grow(self.hW, (d, k))
+                self.b, self.hb = self._grow(self.b, (k,)), self._grow(self.hb, (k,))
+            self.W, self.b, self.last_fit = train_softmax(
+                X, y, k, self.W, self.b,
+                lr=self.lr, l2=self.l2, tol=self.tol,
+                max_epochs=self.max_epochs if first else self.update_epochs,
+                patience=self.patience, batch_size=self.batch_size, dtype=self.dtype,
+                accumulators=(self.hW, self.hb),
+            )
+
+    def _grow(self, arr, shape):
+        # new words/products get zero rows and columns; the rest is kept
+        out = np.zeros(shape, dtype=self.dtype)
+        out[tuple(slice(0, n) for n in arr.shape)] = arr
+        return out
+
+    def train_pending(self):
+        """
+        Train on everything buffered by apply() and persist the result.
+        Returns the number of view events trained on.
+        """
+        with self._lock:
+            if self._buffered <= self.rows_trained and not self._pending:
+                return 0
+            df = pd.concat(self._pending, ignore_index=True) if self._pending else None
+            self._pending = []
+            n = 0
+            if df is not None:
+                df = df.dropna()
+                if not df.empty:
+                    self.partial_fit(df["user"].astype(str).tolist(), df["product_name"].astype(str).tolist())
+                n = len(df)
+            self.views_trained += n
+            self.rows_trained = max(self.rows_trained, self._buffered)
+            self.save()
+            return n
+
+    def snapshot(self):
+        """
+        (W, b, vocab, classes) in the shape recommend() expects.
+        """
+        with self._lock:
+            return (self.W.copy(), self.b.copy(), self.vocab, pd.Index(self.classes))
+
+    def to_arrays(self):
+        """
+        Weights, vocabulary and classes as plain arrays for an npz artifact.
+        """
+        with self._lock:
+            return {
+                "W": self.W.copy(),
+                "b": self.b.copy(),
+                "vocab": np.array(self.vocab.words(), dtype=str),
+                "classes": np.array(self.classes, dtype=str),
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rows_trained": self.rows_trained,
+                "views_trained": self.views_trained,
+                "pending_views": sum(len(p) for p in self._pending),
+                "vocabulary": len(self.vocab),
+                "classes": len(self.classes),
+                "last_fit": self.last_fit,
+            }
+
+
+def model_from_arrays(arrays):
+    """
+    (W, b, vocab, classes) for recommend() from OnlineRecommender.to_arrays().
+    """
+    return (
+        arrays["W"], arrays["b"],
+        Vocabulary(arrays["vocab"].tolist()), pd.Index(arrays["classes"].tolist()),
+    )
@@ -0,0 +1,100 @@
+import collections
+import datetime
+import threading
+
+import pandas as pd
+
+# Dimensions kept per hourly bucket; latitude/longitude ride along with the
+# city so the visitor map can be drawn from the cube as well.
+ROLLUP_DIMS = (
+    "action", "product_name", "user",
+    "geo_country_name", "geo_city", "geo_latitude", "geo_longitude",
+)
+
+
+class EventRollup:
+    """
+    Hourly event counts keyed by action, product, user and geo.
+
+    New events are folded in with `update()` (or `apply()` as an EventStore
+    listener), which only touches the new rows. Dashboard sections then
+    aggregate slices of the cube, whose size depends on the number of
+    distinct (hour, action, product, user, place) combinations rather than
+    on the number of raw events.
+    """
+
+    def __init__(self, dims=ROLLUP_DIMS):
+        self.dims = tuple(dims)
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._cube = None
+        self.events = 0
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._cube = None
+            self.events = 0
+
+    def apply(self, new_events, reset=False):
+        if reset:
+            self.reset()
+        self.update(new_events)
+
+    def update(self, events):
+        if events is None or events.empty:
+            return
+        keys = {"hour": pd.to_datetime(events["timestamp"], errors="coerce").dt.floor("h")}
+        for d in self.dims:
+            keys[d] = events[d] if d in events.columns else None
+        keys = pd.DataFrame(keys, index=events.index)
+        grouped = keys.groupby(list(keys.columns), dropna=False, sort=False).size()
+        with self._lock:
+            for key, n in grouped.items():
+                # normalise NaN/NaT so equal keys hash together
+                self._counts[tuple(None if pd.isna(k) else k for k in key)] += int(n)
+            self.events += len(events)
+            self._cube = None
+
+    def cube(self):
+        with self._lock:
+            if self._cube is None:
+                rows = [(*k, n) for k, n in self._counts.items()]
+                cube = pd.DataFrame(rows, columns=["hour", *self.dims, "count"])
+                cube["hour"] = pd.to_datetime(cube["hour"])
+                for d in ("geo_latitude", "geo_longitude"):
+                    if d in cube.columns:
+                        cube[d] = pd.to_numeric(cube[d], errors="coerce")
+                self._cube = cube
+            return self._cube
+
+    def slice(self, actions=None, products=None, users=None, start_date=None, end_date=None):
+        """
+        Cube rows matching the dashboard filters (dates are inclusive).
+        """
+        cube = self.cube()
+        mask = pd.Series(True, index=cube.index)
+        if actions is not None:
+            mask &= cube["action"].isin(actions)
+        if products is not None:
+            mask &= cube["product_name"].isin(products)
+        if users is not None:
+            mask &= cube["user"].isin(users)
+        if start_date is not None:
+            mask &= cube["hour"] >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= cube["hour"] < pd.Timestamp(end_date + datetime.timedelta(days=1))
+        return cube[mask]
+
+
+def count_by(cube, column, name="count"):
+    """
+    Sum of event counts per value of `column`, largest first.
+    """
+    return (
+        cube.dropna(subset=[column])
+        .groupby(column)["count"]
+        .sum()
+        .reset_index(name=name)
+        .sort_values(name, ascending=False)
+    )
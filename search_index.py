@@ -0,0 +1,169 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """
+    Inverted index over product text with prefix matching and BM25 ranking.
+
+    Every query token matches as a prefix ("lap" finds "laptop"), and a
+    product must match all query tokens. Postings are kept per term as
+    numpy arrays of (document, term frequency), so a query only touches the
+    postings of the terms it names. `add()` indexes one more product in
+    place; only the postings of its own terms are rebuilt.
+
+    Prefixes that match very many terms are capped to the
+    `max_expansions` most common of them, which keeps one- or two-letter
+    queries bounded on large catalogs.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, max_expansions=50):
+        self.k1 = k1
+        self.b = b
+        self.max_expansions = max_expansions
+        self._lock = threading.Lock()
+        self._ids = []          # internal doc number -> product id
+        self._rows = {}         # product id -> internal doc number
+        self._lengths = []
+        self._postings = {}     # term -> ([doc], [tf])
+        self._arrays = {}       # term -> (doc array, tf array), built lazily
+        self._terms = []        # sorted vocabulary for prefix lookup
+        self._expansions = {}   # prefix -> expanded terms, cleared on add
+        self._total_length = 0
+        self._norm = None       # BM25 length normalisation per document
+
+    @classmethod
+    def build(cls, docs, **kwargs):
+        """
+        Index an iterable of (product_id, text) pairs.
+        """
+        index = cls(**kwargs)
+        with index._lock:
+            for doc_id, text in docs:
+                index._add(doc_id, text)
+            index._terms = sorted(index._postings)
+        return index
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _add(self, doc_id, text):
+        # caller holds self._lock
+        if doc_id in self._rows:
+            raise ValueError(f"product {doc_id!r} is already indexed")
+        row = len(self._ids)
+        self._ids.append(doc_id)
+        self._rows[doc_id] = row
+        tokens = tokenize(text)
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        self._norm = None
+        counts = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        new_terms = []
+        for t, tf in counts.items():
+            postings = self._postings.get(t)
+            if postings is None:
+                postings = self._postings[t] = ([], [])
+                new_terms.append(t)
+            postings[0].append(row)
+            postings[1].append(tf)
+            self._arrays.pop(t, None)
+        return new_terms
+
+    def add(self, doc_id, text):
+        with self._lock:
+            for t in self._add(doc_id, text):
+                bisect.insort(self._terms, t)
+            self._expansions.clear()
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            docs, tfs = self._postings[term]
+            arrays = self._arrays[term] = (
+                np.array(docs, dtype=np.int64), np.array(tfs, dtype=np.float64)
+            )
+        return arrays
+
+    def expand(self, prefix):
+        """
+        Indexed terms starting with `prefix`, the most common first when
+        the list had to be capped.
+        """
+        terms = self._expansions.get(prefix)
+        if terms is None:
+            lo = bisect.bisect_left(self._terms, prefix)
+            hi = bisect.bisect_left(self._terms, prefix + "\U0010ffff", lo)
+            terms = self._terms[lo:hi]
+            if len(terms) > self.max_expansions:
+                terms = heapq.nlargest(self.max_expansions, terms, key=lambda t: len(self._postings[t][0]))
+            self._expansions[prefix] = terms
+        return terms
+
+    def stats(self):
+        with self._lock:
+            return {"products": len(self._ids), "terms": len(self._terms)}
+
+    def search(self, query, limit=None):
+        """
+        Product ids matching every token of `query`, best BM25 score first.
+        An empty query returns an empty list.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            n = len(self._ids)
+            if n == 0:
+                return []
+            if self._norm is None:
+                lengths = np.array(self._lengths, dtype=np.float64)
+                avgdl = self._total_length / n or 1.0
+                self._norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+            # only the postings of the expanded terms are touched, never all n documents
+            found = None
+            hits, gains = [], []
+            for token in tokens:
+                terms = self.expand(token)
+                if not terms:
+                    return []
+                token_docs = []
+                for term in terms:
+                    docs, tfs = self._term_arrays(term)
+                    idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                    token_docs.append(docs)
+                    hits.append(docs)
+                    gains.append(idf * tfs * (self.k1 + 1) / (tfs + self._norm[docs]))
+                if len(token_docs) == 1:
+                    token_docs = token_docs[0]  # postings are already sorted and unique
+                else:
+                    token_docs = np.sort(np.concatenate(token_docs))
+                    token_docs = token_docs[np.r_[True, token_docs[1:] != token_docs[:-1]]]
+                found = token_docs if found is None else np.intersect1d(found, token_docs, assume_unique=True)
+                if not len(found):
+                    return []
+            docs = np.concatenate(hits)
+            gains = np.concatenate(gains)
+            if len(tokens) > 1:
+                keep = np.isin(docs, found)
+                docs, gains = docs[keep], gains[keep]
+            scores = np.bincount(np.searchsorted(found, docs), gains, len(found))
+            if limit and limit < len(found):
+                top = np.argpartition(-scores, limit - 1)[:limit]
+                order = found[top[np.argsort(-scores[top], kind="stable")]]
+            else:
+                order = found[np.argsort(-scores, kind="stable")]
+            return [self._ids[i] for i in order]
@@ -0,0 +1,113 @@
+import sys
+import threading
+
+EVENT_HEADER = ["timestamp", "user", "product_id", "product_name", "action", "extra"]
+
+# 401/403 mean the token or the sharing settings changed, 404 that the
+# spreadsheet or worksheet is gone; in all cases the cached handles are stale.
+INVALIDATING_STATUS = (401, 403, 404)
+
+
+def is_auth_error(exc):
+    """
+    True for errors after which the cached client/worksheets must be rebuilt.
+    """
+    # neither library can have raised anything before it was imported
+    auth = sys.modules.get("google.auth.exceptions")
+    if auth is not None and isinstance(exc, auth.RefreshError):
+        return True
+    gspread = sys.modules.get("gspread")
+    if gspread is not None and isinstance(exc, gspread.exceptions.APIError):
+        code = getattr(exc, "code", None)
+        if code is None and getattr(exc, "response", None) is not None:
+            code = exc.response.status_code
+        return code in INVALIDATING_STATUS
+    return False
+
+
+class SheetCache:
+    """
+    Thread-safe, process-wide cache of the gspread client, the spreadsheet
+    and its worksheets.
+
+    Credentials are built and authorized once; the access token is refreshed
+    in place when it expires instead of re-authorizing. Worksheet lookup,
+    creation and the header check happen once per worksheet per process.
+    """
+
+    def __init__(self, service_account_info, sheet_id,
+                 scopes=("https://www.googleapis.com/auth/spreadsheets",)):
+        self.service_account_info = dict(service_account_info)
+        self.sheet_id = sheet_id
+        self.scopes = list(scopes)
+        self._lock = threading.RLock()
+        self._creds = None
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+
+    def client(self):
+        # imported on first use so pages that never touch the sheet skip them
+        import gspread
+        from google.auth.transport.requests import Request
+        from google.oauth2.service_account import Credentials
+
+        with self._lock:
+            if self._client is None:
+                self._creds = Credentials.from_service_account_info(
+                    self.service_account_info, scopes=self.scopes
+                )
+                self._client = gspread.authorize(self._creds)
+            elif not self._creds.valid:
+                self._creds.refresh(Request())
+            return self._client
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.client().open_by_key(self.sheet_id)
+            else:
+                self.client()
+            return self._spreadsheet
+
+    def worksheet(self, title="views", header=None, rows="2000", cols="20"):
+        """
+        Return the cached worksheet, creating it (and its header row) on
+        first use.
+        """
+        import gspread
+
+        with self._lock:
+            ws = self._worksheets.get(title)
+            if ws is not None:
+                self.client()
+                return ws
+            sh = self.spreadsheet()
+            try:
+                ws = sh.worksheet(title)
+            except gspread.exceptions.WorksheetNotFound:
+                ws = sh.add_worksheet(title=title, rows=rows, cols=cols)
+            if header:
+                try:
+                    first = ws.acell("A1").value
+                except Exception:
+                    first = None
+                if not first:
+                    end = chr(ord("A") + len(header) - 1)
+                    ws.update(f"A1:{end}1", [list(header)])
+            self._worksheets[title] = ws
+            return ws
+
+    def invalidate(self, exc=None):
+        """
+        Drop every cached handle. When `exc` is given, only do so for
+        auth/permission errors; returns True if the cache was cleared.
+        """
+        if exc is not None and not is_auth_error(exc):
+            return False
+        with self._lock:
+            self._creds = None
+            self._client = None
+            self._spreadsheet = None
+            self._worksheets = {}
+        return True
@@ -0,0 +1,99 @@
+import numpy as np
+
+from catalog_snapshot import CatalogLoader, CatalogSnapshot
+
+PRODUCTS = [
+    {"id": 1, "name": "Laptop", "price": 55000, "category": "Computers", "img": "a"},
+    {"id": 2, "name": "iPhone 16", "price": 80000, "category": "Phones", "img": "b"},
+    {"id": 3, "name": "Keyboard", "price": 1500, "category": "Accessories", "img": "c"},
+    {"id": 4, "name": "Watch", "price": 7000, "category": "Wearables", "img": "d"},
+    {"id": 5, "name": "Headphone", "price": 1500, "category": "Accessories", "img": "e"},
+    {"id": 6, "name": "Mouse", "price": "n/a", "category": "Accessories", "img": "f"},
+]
+
+
+def ids(snap, rows):
+    return [p["id"] for p in snap.take(rows)]
+
+
+def test_sorts_match_stable_sorted():
+    snap = CatalogSnapshot.from_products(PRODUCTS)
+    priced = [p for p in PRODUCTS if isinstance(p["price"], int)]
+    by_price = [p["id"] for p in sorted(priced, key=lambda p: p["price"])]
+    assert ids(snap, snap.select(sort="price")) == by_price + [6]  # unparseable price last
+    assert ids(snap, snap.select(sort="name")) == [p["id"] for p in sorted(PRODUCTS, key=lambda p: p["name"])]
+    # ties (Keyboard and Headphone at 1500) keep catalog order in both directions
+    assert ids(snap, snap.select(sort="-price"))[3:5] == [3, 5]
+
+
+def test_filters_combine():
+    snap = CatalogSnapshot.from_products(PRODUCTS)
+    assert ids(snap, snap.select(categories=["Accessories"])) == [3, 5, 6]
+    assert ids(snap, snap.select(categories=["Accessories", "Phones"], sort="-price")) == [2, 3, 5, 6]
+    assert ids(snap, snap.select(price_min=5000, price_max=60000)) == [1, 4]
+    assert ids(snap, snap.select(categories=["Accessories"], price_max=2000)) == [3, 5]
+    assert ids(snap, snap.select(categories=["Nope"])) == []
+
+
+def test_ids_order_is_kept_without_a_sort():
+    snap = CatalogSnapshot.from_products(PRODUCTS)
+    # e.g. search results, best match first; unknown ids are dropped
+    assert ids(snap, snap.select(ids=[5, 99, 1, 3])) == [5, 1, 3]
+    assert ids(snap, snap.select(ids=[5, 1, 3], sort="price")) == [3, 5, 1]
+    assert ids(snap, snap.select(categories=["Accessories"], ids=[5, 1, 3])) == [5, 3]
+
+
+def test_facets_and_lookup():
+    snap = CatalogSnapshot.from_products(PRODUCTS)
+    assert snap.categories == ["Accessories", "Computers", "Phones", "Wearables"]
+    assert snap.facets["Accessories"] == 3
+    assert snap.price_range == (1500, 80000)
+    assert snap.get(2) == PRODUCTS[1]
+    assert snap.get(42) is None
+
+
+def test_sparse_ids_use_the_dict_index():
+    products = [dict(p, id=p["id"] * 10**9) for p in PRODUCTS]
+    snap = CatalogSnapshot.from_products(products)
+    assert snap.row_of(3 * 10**9) == 2
+    assert list(snap.rows_of([5 * 10**9, 7])) == [4]
+
+
+def test_version_tracks_content():
+    a = CatalogSnapshot.from_products(PRODUCTS)
+    b = CatalogSnapshot.from_products(PRODUCTS)
+    assert a.version == b.version
+    changed = [dict(p, price=2500) if p["id"] == 3 else p for p in PRODUCTS]
+    assert CatalogSnapshot.from_products(changed).version != a.version
+    assert a.with_images(["z"]).version != a.version
+
+
+def test_loader_fetches_only_when_the_version_changes():
+    state = {"version": 1, "fetches": 0}
+
+    def fetch():
+        state["fetches"] += 1
+        return CatalogSnapshot.from_products(PRODUCTS[:state["version"]])
+
+    loader = CatalogLoader(fetch, lambda: state["version"], interval=3600)
+    first = loader.get()
+    assert not loader.refresh()
+    assert state["fetches"] == 1
+
+    state["version"] = 3
+    assert loader.refresh()
+    assert len(loader.get()) == 3 and loader.get() is not first
+    loader.stop()
+
+
+def test_loader_serves_fallback_until_first_fetch():
+    fallback = CatalogSnapshot.from_products(PRODUCTS[:1])
+
+    def fetch():
+        raise RuntimeError("sheet down")
+
+    loader = CatalogLoader(fetch, lambda: 1, fallback=fallback, interval=3600)
+    assert loader.get() is fallback and loader.from_fallback
+    assert "sheet down" in loader.stats()["last_error"]
+    loader.stop()
+    assert np.array_equal(loader.get().ids, [1])
@@ -0,0 +1,80 @@
+import pandas as pd
+
+from cooccurrence import ItemCooccurrence
+
+T0 = pd.Timestamp("2024-01-01 10:00")
+
+
+def rows(*events):
+    return pd.DataFrame(events, columns=["user", "timestamp", "action", "product_name"])
+
+
+def sessions(*baskets, action="view"):
+    """
+    One user per basket, all at T0, then a later event that closes them.
+    """
+    events = [(f"s{n}", T0, action, item) for n, basket in enumerate(baskets) for item in basket]
+    return rows(*events, ("closer", T0 + pd.Timedelta(days=1), "view", "Z"))
+
+
+def test_sessions_are_counted_once_closed():
+    model = ItemCooccurrence(session_gap=1800)
+    model.update(rows(("u1", T0, "view", "A"), ("u1", T0 + pd.Timedelta(minutes=5), "view", "B")))
+    assert model.stats() == {"sessions": 0, "open_events": 2, "pairs": 0}
+    assert model.neighbors("A") == []
+
+    # a later event of the same user, past the gap, closes the first session
+    model.update(rows(("u1", T0 + pd.Timedelta(hours=2), "view", "C")))
+    assert model.counts("view").to_dict() == {("A", "B"): 1, ("B", "A"): 1}
+    assert model.stats()["sessions"] == 1
+    assert model.neighbors("A") == ["B"]
+
+    # another user's event a gap later closes the quiet one
+    model.update(rows(("u2", T0 + pd.Timedelta(hours=3), "view", "D")))
+    assert model.stats() == {"sessions": 2, "open_events": 1, "pairs": 2}
+
+
+def test_events_within_the_gap_share_a_session():
+    model = ItemCooccurrence(session_gap=1800)
+    model.update(rows(
+        ("u1", T0, "view", "A"),
+        ("u1", T0 + pd.Timedelta(minutes=20), "view", "B"),
+        ("u1", T0 + pd.Timedelta(minutes=40), "view", "C"),
+        ("u1", T0 + pd.Timedelta(hours=3), "view", "D"),
+    ))
+    assert set(model.neighbors("A")) == {"B", "C"}
+    assert model.neighbors("D") == []
+
+
+def test_actions_are_weighted():
+    events = pd.concat([
+        sessions(["A", "B"], ["A", "B"]),
+        rows(("buyer", T0, "order", "A"), ("buyer", T0, "order", "C")),
+    ], ignore_index=True)
+    # two co-views score 1 * 1.0, one co-purchase 1 * 3.0
+    model = ItemCooccurrence()
+    model.update(events)
+    assert model.neighbors("A") == ["C", "B"]
+
+    model = ItemCooccurrence(weights={"view": 1.0, "order": 0.1})
+    model.update(events)
+    assert model.neighbors("A") == ["B", "C"]
+
+
+def test_scores_are_cosine_normalised():
+    # P is seen with A more often than Q is, but P is in every session
+    baskets = [["A", "P"]] * 3 + [["A", "Q"]] * 2 + [["P"]] * 7
+    model = ItemCooccurrence()
+    model.update(sessions(*baskets))
+    assert model.counts()[("A", "P")] == 3
+    assert model.counts()[("A", "Q")] == 2
+    assert model.neighbors("A") == ["Q", "P"]
+
+
+def test_neighbors_are_cut_to_topk():
+    baskets = [["A", "B"]] * 4 + [["A", "C"]] * 3 + [["A", "D"]] * 2 + [["A", "E"]]
+    model = ItemCooccurrence(topk=2)
+    model.update(sessions(*baskets))
+    assert model.neighbors("A") == ["B", "C"]
+    assert model.neighbors("A", k=1) == ["B"]
+    assert model.neighbors("E") == ["A"]
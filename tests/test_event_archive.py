@@ -0,0 +1,74 @@
+import pandas as pd
+
+from event_archive import EventArchive
+
+
+def events(n, start=0):
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=n, freq="h") + pd.Timedelta(hours=start),
+        "user": [f"u{i % 3}" for i in range(start, start + n)],
+        "product_id": [str(i % 5) for i in range(start, start + n)],
+        "product_name": [f"p{i % 5}" for i in range(start, start + n)],
+        "action": ["view" if i % 2 else "order" for i in range(start, start + n)],
+    })
+
+
+def make_archive(path):
+    return EventArchive(str(path), flush_interval=3600)
+
+
+def test_reset_with_pending_rows_does_not_duplicate(tmp_path):
+    archive = make_archive(tmp_path)
+    archive.apply(events(0), reset=True)
+    archive.apply(events(10))
+    archive.flush()
+    archive.apply(events(9, start=10))  # still buffered when the store reloads
+
+    archive.apply(events(0), reset=True)
+    archive.apply(events(20))
+    archive.flush()
+
+    assert len(archive.query()) == 20
+    assert archive.query()["timestamp"].is_unique
+    assert len(archive.query(actions=["view"])) == 10
+    archive.close()
+
+
+def test_replay_resumes_after_restart(tmp_path):
+    archive = make_archive(tmp_path)
+    archive.apply(events(0), reset=True)
+    archive.apply(events(8))
+    archive.close()
+
+    archive = make_archive(tmp_path)
+    archive.apply(events(0), reset=True)
+    archive.apply(events(12))
+    archive.flush()
+    assert len(archive.query()) == 12
+    assert archive.rebuilds == 0
+    archive.close()
+
+
+def test_shorter_replay_rebuilds_archive(tmp_path):
+    archive = make_archive(tmp_path)
+    archive.apply(events(0), reset=True)
+    archive.apply(events(18))
+    archive.close()
+
+    # rows were deleted from the sheet: the counter (18) exceeds the sheet
+    archive = make_archive(tmp_path)
+    archive.apply(events(0), reset=True)
+    archive.apply(events(6))
+    archive.apply(events(2, start=6))
+    archive.flush()
+    assert archive.rebuilds == 1
+    assert len(archive.query()) == 8
+
+    archive.close()
+    archive = make_archive(tmp_path)
+    archive.apply(events(0), reset=True)
+    archive.apply(events(9))
+    archive.flush()
+    assert archive.rebuilds == 0
+    assert len(archive.query()) == 9
+    archive.close()
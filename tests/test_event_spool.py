@@ -0,0 +1,133 @@
+import sqlite3
+import threading
+
+import pytest
+
+from event_spool import EventSpool, SpoolReplayer
+from event_writer import PartialWriteError
+
+
+def make_replayer(spool, sink, batch_size=3):
+    return SpoolReplayer(spool, sink, batch_size=batch_size, interval=3600)
+
+
+def test_replay_delivers_in_order_and_empties_spool(tmp_path):
+    spool = EventSpool(str(tmp_path / "spool.db"))
+    spool.append([["r", i] for i in range(7)])
+    sent = []
+    replayer = make_replayer(spool, sent.extend)
+
+    assert replayer.drain_once() == 7
+    assert sent == [["r", i] for i in range(7)]
+    assert spool.count() == 0
+    replayer.stop()
+    spool.close()
+
+
+def test_failed_batch_is_kept_and_retried_once(tmp_path):
+    spool = EventSpool(str(tmp_path / "spool.db"))
+    spool.append([["r", i] for i in range(5)])
+    sent = []
+    failures = [RuntimeError("sheet down")]
+
+    def sink(rows):
+        if failures:
+            raise failures.pop()
+        sent.extend(rows)
+
+    replayer = make_replayer(spool, sink)
+    with pytest.raises(RuntimeError):
+        replayer.drain_once()
+    assert spool.count() == 5
+
+    # the failed batch was released, not left leased until it expires
+    assert replayer.drain_once() == 5
+    assert sent == [["r", i] for i in range(5)]
+    replayer.stop()
+    spool.close()
+
+
+def test_claimed_rows_are_not_claimed_again(tmp_path):
+    path = str(tmp_path / "spool.db")
+    first, second = EventSpool(path), EventSpool(path)
+    first.append([["r", i] for i in range(4)])
+
+    a = first.claim(3)
+    b = second.claim(3)
+    assert [i for i, _ in a] == [1, 2, 3]
+    assert [i for i, _ in b] == [4]
+    assert second.claim(3) == []
+
+    first.release([i for i, _ in a])
+    assert [i for i, _ in second.claim(3)] == [1, 2, 3]
+    first.close()
+    second.close()
+
+
+def test_expired_lease_is_claimable(tmp_path):
+    spool = EventSpool(str(tmp_path / "spool.db"))
+    spool.append([["r", 0]])
+    assert len(spool.claim(lease=-1)) == 1  # a replayer that died mid-batch
+    assert spool.claim() == [(1, ["r", 0])]
+    spool.close()
+
+
+def test_concurrent_replayers_deliver_each_row_once(tmp_path):
+    path = str(tmp_path / "spool.db")
+    EventSpool(path).append([["r", i] for i in range(200)])
+    sent = []
+    lock = threading.Lock()
+
+    def sink(rows):
+        with lock:
+            sent.extend(rows)
+
+    replayers = [make_replayer(EventSpool(path), sink, batch_size=7) for _ in range(4)]
+    threads = [threading.Thread(target=r.drain_once) for r in replayers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(i for _, i in sent) == list(range(200))
+    assert sum(r.replayed for r in replayers) == 200
+    for r in replayers:
+        r.stop()
+
+
+def test_spool_without_lease_column_is_upgraded(tmp_path):
+    path = str(tmp_path / "spool.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE spool (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                 "created REAL NOT NULL, row TEXT NOT NULL)")
+    conn.execute("INSERT INTO spool (created, row) VALUES (0, '[1, 2]')")
+    conn.commit()
+    conn.close()
+
+    spool = EventSpool(path)
+    assert spool.claim() == [(1, [1, 2])]
+    spool.close()
+
+
+def test_partial_failure_acks_delivered_rows_and_holds_rejected(tmp_path):
+    spool = EventSpool(str(tmp_path / "spool.db"))
+    spool.append([["r", i] for i in range(6)])
+    sent = []
+
+    def sink(rows):
+        bad = [n for n, row in enumerate(rows) if row[1] == 1]
+        sent.extend(row for n, row in enumerate(rows) if n not in bad)
+        if bad:
+            raise PartialWriteError([rows[n] for n in bad], RuntimeError("invalid"), bad)
+
+    replayer = make_replayer(spool, sink)
+    with pytest.raises(PartialWriteError):
+        replayer.drain_once()
+    # the rows behind the rejected one were still drained
+    assert sorted(i for _, i in sent) == [0, 2, 3, 4, 5]
+    assert spool.rows() == [["r", 1]]
+    assert replayer.rejected == 1
+    # still leased: not retried on every pass
+    assert replayer.drain_once() == 0
+    replayer.stop()
+    spool.close()
@@ -0,0 +1,158 @@
+import json
+import math
+import re
+
+import event_store
+from event_store import EventStore, decode_extra_column
+from sheets import EVENT_HEADER
+
+
+class FakeWorksheet:
+    def __init__(self, n=0):
+        self.rows = [EVENT_HEADER]
+        self.add(n)
+
+    def add(self, n):
+        start = len(self.rows) - 1
+        for i in range(start, start + n):
+            self.rows.append([f"2024-01-01 {i % 24:02d}:00:00", f"u{i}", str(i), f"p{i}", "view", "{}"])
+
+    def get_values(self, rng):
+        first, last = map(int, re.match(r"A(\d+):[A-Z]+(\d+)", rng).groups())
+        return [list(r) for r in self.rows[first - 1:last]]
+
+
+def make_store(ws):
+    return EventStore(lambda: ws, chunk_rows=4, max_age=0)
+
+
+def test_listeners_see_every_row_once_in_order():
+    ws = FakeWorksheet(3)
+    store = make_store(ws)
+    store.refresh()
+    seen = []
+    store.add_listener(lambda rows, reset: seen.extend(rows["user"]))
+    ws.add(2)
+    store.refresh()
+    assert seen == ["u0", "u1", "u2", "u3", "u4"]
+
+
+def test_failing_listener_does_not_stop_the_others():
+    ws = FakeWorksheet(2)
+    store = make_store(ws)
+    seen = []
+
+    def broken(rows, reset):
+        raise RuntimeError("listener bug")
+
+    store.add_listener(broken)
+    store.add_listener(lambda rows, reset: seen.extend(rows["user"]))
+    ws.add(1)
+    frame = store.refresh()
+
+    assert len(frame) == 3
+    assert seen == ["u0", "u1", "u2"]
+    assert store.listener_errors == 2
+    assert "listener bug" in store.stats()["last_error"]
+
+
+def test_listener_can_read_the_store():
+    ws = FakeWorksheet(1)
+    store = make_store(ws)
+    sizes = []
+    store.add_listener(lambda rows, reset: sizes.append(store.stats()["rows"]))
+    ws.add(1)
+    store.refresh()
+    assert sizes == [0, 2]
+
+
+def test_refresh_reads_only_rows_past_the_high_water_mark():
+    ws = FakeWorksheet(5)
+    store = make_store(ws)
+    reads = []
+    get_values = ws.get_values
+    ws.get_values = lambda rng: reads.append(rng) or get_values(rng)
+
+    assert store.refresh()["user"].tolist() == [f"u{i}" for i in range(5)]
+    assert reads == ["A2:F5", "A6:F9"]
+    assert store.rows_fetched == 5
+
+    reads.clear()
+    ws.add(2)
+    assert len(store.refresh()) == 7
+    # the last ingested row is re-read to check the sheet was not rewritten
+    assert reads == ["A6:F9"]
+    assert store.rows_fetched == 7
+    assert store.reloads == 0
+
+    reads.clear()
+    store.refresh()
+    assert reads == ["A8:F11"]
+    assert store.rows_fetched == 7
+
+
+def test_rewritten_sheet_is_reloaded():
+    ws = FakeWorksheet(4)
+    store = make_store(ws)
+    resets = []
+    store.add_listener(lambda rows, reset: resets.append(reset))
+    store.refresh()
+
+    ws.rows[4][1] = "changed"  # the last ingested row no longer matches
+    frame = store.refresh()
+    assert frame["user"].tolist() == ["u0", "u1", "u2", "changed"]
+    assert store.reloads == 1
+    assert store.rows_fetched == 8
+    assert resets == [True, False, True, False]
+
+
+def test_returned_frame_is_not_the_store():
+    store = make_store(FakeWorksheet(2))
+    frame = store.refresh()
+    frame["timestamp"] = "replaced"
+    frame["new"] = 1
+    again = store.refresh()
+    assert "new" not in again
+    assert str(again["timestamp"].dtype).startswith("datetime64")
+
+
+def count_loads(monkeypatch):
+    calls = []
+    real = json.loads
+
+    def loads(text):
+        calls.append(text)
+        return real(text)
+
+    monkeypatch.setattr(event_store.json, "loads", loads)
+    return calls
+
+
+def test_well_formed_column_is_parsed_in_one_call(monkeypatch):
+    calls = count_loads(monkeypatch)
+    geo = decode_extra_column([
+        '{"ip": "1.1.1.1", "city": "C", "latitude": "12.5", "other": 1}',
+        {"city": "D", "longitude": 3},
+        None,
+        "",
+    ])
+    assert len(calls) == 1
+    assert list(geo.columns) == ["geo_ip", "geo_city", "geo_region", "geo_country_name", "geo_latitude", "geo_longitude"]
+    assert geo["geo_city"].tolist() == ["C", "D", None, None]
+    assert geo["geo_latitude"].iloc[0] == 12.5
+    assert geo["geo_longitude"].iloc[1] == 3
+
+
+def test_malformed_and_empty_cells_decode_to_nothing(monkeypatch):
+    calls = count_loads(monkeypatch)
+    geo = decode_extra_column(['{"city": "C"}', "{not json", "   ", float("nan"), '1, 2', '{"latitude": "north"}'])
+    # one attempt over the whole column, then one per cell
+    assert len(calls) == 1 + 6
+    assert geo["geo_city"].tolist() == ["C", None, None, None, None, None]
+    assert math.isnan(geo["geo_latitude"].iloc[5])
+
+
+def test_json_values_that_are_not_objects_are_ignored():
+    geo = decode_extra_column(['[1, 2]', '"text"', "5", "null", '{"city": "C"}'])
+    assert geo["geo_city"].tolist() == [None, None, None, None, "C"]
+    assert geo["geo_ip"].isna().all()
@@ -0,0 +1,124 @@
+import pytest
+
+from event_writer import BufferedEventWriter, MongoEventWriter, PartialWriteError, insert_documents
+
+
+class FakeWorksheet:
+    def __init__(self):
+        self.batches = []
+
+    def append_rows(self, rows, value_input_option=None):
+        self.batches.append(list(rows))
+
+
+class FakeCollection:
+    """
+    insert_many that rejects the documents whose "bad" field is set, like
+    an unordered insert that keeps going past them.
+    """
+
+    def __init__(self, codes=None):
+        self.docs = []
+        self.codes = codes or {}
+
+    def insert_many(self, docs, ordered=True):
+        from pymongo.errors import BulkWriteError
+
+        errors = []
+        for i, doc in enumerate(docs):
+            if doc.get("bad"):
+                errors.append({"index": i, "code": self.codes.get(doc["n"], 121), "errmsg": "rejected"})
+            else:
+                self.docs.append(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+
+
+def test_rows_are_batched_and_flushed():
+    ws = FakeWorksheet()
+    writer = BufferedEventWriter(lambda: ws, max_batch=3, flush_interval=60)
+    for i in range(7):
+        writer.submit([i])
+    assert writer.flush()
+    assert [len(b) for b in ws.batches] == [3, 3, 1]
+    assert writer.stats()["rows_written"] == 7
+    writer.close()
+
+
+def test_failed_batch_goes_to_on_error():
+    failed = []
+
+    def broken():
+        raise RuntimeError("sheet down")
+
+    writer = BufferedEventWriter(broken, flush_interval=60, on_error=lambda rows, exc: failed.extend(rows))
+    writer.submit_many([[1], [2]])
+    writer.flush()
+    assert failed == [[1], [2]]
+    assert writer.stats()["failed_batches"] == 1
+    writer.close()
+
+
+def test_mongo_writer_spools_only_rejected_docs():
+    pytest.importorskip("pymongo")
+    col = FakeCollection()
+    spooled = []
+    writer = MongoEventWriter(col, flush_interval=60, on_error=lambda docs, exc: spooled.extend(docs))
+    writer.submit_many([{"n": i, "bad": i in (1, 3)} for i in range(5)])
+    writer.flush()
+
+    assert [d["n"] for d in col.docs] == [0, 2, 4]
+    assert [d["n"] for d in spooled] == [1, 3]
+    assert writer.stats()["rows_written"] == 3
+    writer.close()
+
+
+def test_mongo_writer_drops_duplicate_key_errors():
+    pytest.importorskip("pymongo")
+    col = FakeCollection(codes={1: MongoEventWriter.DUPLICATE_KEY})
+    spooled = []
+    writer = MongoEventWriter(col, flush_interval=60, on_error=lambda docs, exc: spooled.extend(docs))
+    writer.submit_many([{"n": i, "bad": i in (1, 2)} for i in range(3)])
+    writer.flush()
+
+    assert [d["n"] for d in spooled] == [2]
+    writer.close()
+
+
+class KeyedCollection:
+    """
+    insert_many with a unique _id, which it sets on documents lacking one.
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    def insert_many(self, docs, ordered=True):
+        from pymongo.errors import BulkWriteError
+
+        errors = []
+        for i, doc in enumerate(docs):
+            doc.setdefault("_id", f"id{len(self.docs) + i}")
+            if doc.get("bad"):
+                errors.append({"index": i, "code": 121})
+            elif doc["_id"] in self.docs:
+                errors.append({"index": i, "code": 11000})
+            else:
+                self.docs[doc["_id"]] = doc
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def test_resending_a_batch_only_reports_real_failures():
+    pytest.importorskip("pymongo")
+    col = KeyedCollection()
+    docs = [{"n": 0}, {"n": 1, "bad": True}, {"n": 2}]
+    with pytest.raises(PartialWriteError) as first:
+        insert_documents(col, docs)
+    assert first.value.indices == [1]
+
+    # a replay of the same batch, _ids included, inserts no copies
+    with pytest.raises(PartialWriteError) as again:
+        insert_documents(col, [dict(d) for d in docs])
+    assert again.value.indices == [1]
+    assert sorted(d["n"] for d in col.docs.values()) == [0, 2]
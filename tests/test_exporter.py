@@ -0,0 +1,46 @@
+import io
+
+import pandas as pd
+import pytest
+
+from exporter import ExportTooLarge, export_bytes, export_frames
+
+
+def chunks(n, size=100):
+    for start in range(0, n, size):
+        yield pd.DataFrame({"n": range(start, min(start + size, n)), "extra": [{"k": 1}] * min(size, n - start)})
+
+
+@pytest.mark.parametrize("fmt", ["CSV", "JSONL", "Parquet"])
+def test_chunks_round_trip(fmt):
+    data = export_bytes(chunks(250), fmt)
+    if fmt == "CSV":
+        df = pd.read_csv(io.BytesIO(data))
+    elif fmt == "JSONL":
+        df = pd.read_json(io.BytesIO(data), lines=True)
+    else:
+        df = pd.read_parquet(io.BytesIO(data))
+    assert df["n"].tolist() == list(range(250))
+
+
+def test_oversized_export_stops_early():
+    pulled = []
+
+    def frames():
+        for df in chunks(100_000):
+            pulled.append(len(df))
+            yield df
+
+    with pytest.raises(ExportTooLarge, match="larger than"):
+        export_bytes(frames(), "CSV", max_bytes=10_000)
+    assert len(pulled) < 10
+
+
+def test_last_chunk_counts_towards_cap():
+    with pytest.raises(ExportTooLarge):
+        export_frames([pd.DataFrame({"n": range(10_000)})], "CSV", max_bytes=1_000)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        export_bytes(chunks(1), "XML")
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from event_store import decode_events, fill_geo
+from geo import GeoCache, GeoEnricher, RangeGeoResolver, lookup_from_env, make_lookup
+
+
+def test_cache_hits_failures_and_eviction():
+    calls = []
+
+    def lookup(ip):
+        calls.append(ip)
+        if ip == "bad":
+            raise RuntimeError("geo api down")
+        return {"ip": ip, "city": "C"}
+
+    cache = GeoCache(lookup, maxsize=2, negative_ttl=300)
+    assert cache.get("1.1.1.1")["city"] == "C"
+    assert cache.get("1.1.1.1")["city"] == "C"
+    assert cache.get("bad") == {"ip": "bad"}
+    assert cache.get("bad") == {"ip": "bad"}  # failure is cached too
+    cache.get("2.2.2.2")  # evicts 1.1.1.1, the least recently used
+    assert cache.peek("1.1.1.1") is None
+    assert calls == ["1.1.1.1", "bad", "2.2.2.2"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entry_is_looked_up_again():
+    calls = []
+    cache = GeoCache(lambda ip: calls.append(ip) or {"ip": ip}, ttl=0)
+    cache.get("1.1.1.1")
+    cache.get("1.1.1.1")
+    assert calls == ["1.1.1.1", "1.1.1.1"]
+
+
+def test_concurrent_misses_share_one_lookup():
+    calls = []
+    release = threading.Event()
+
+    def lookup(ip):
+        calls.append(ip)
+        release.wait(5)
+        return {"ip": ip, "city": "C"}
+
+    cache = GeoCache(lookup)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("1.1.1.1"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == ["1.1.1.1"]
+    assert all(r["city"] == "C" for r in results)
+
+
+def test_enricher_records_rows_at_once_and_resolves_in_background():
+    rows = []
+    release = threading.Event()
+
+    def slow_lookup(ip):
+        release.wait(5)
+        return {"ip": ip, "city": "C"}
+
+    cache = GeoCache(slow_lookup)
+    cache.put("1.1.1.1", {"ip": "1.1.1.1", "city": "Known"})
+    enricher = GeoEnricher(cache, rows.append, workers=2)
+
+    enricher.submit("1.1.1.1", lambda geo: ("t0", geo))
+    enricher.submit("2.2.2.2", lambda geo: ("t1", geo))
+    enricher.submit("2.2.2.2", lambda geo: ("t2", geo))
+    # nothing waits on the slow lookup, and only one is queued per IP
+    assert rows == [("t0", {"ip": "1.1.1.1", "city": "Known"}), ("t1", {"ip": "2.2.2.2"}), ("t2", {"ip": "2.2.2.2"})]
+    assert enricher.stats()["pending"] == 1
+
+    release.set()
+    enricher.close()
+    assert cache.peek("2.2.2.2")["city"] == "C"
+    assert enricher.stats() == {"pending": 0, "inline": 1, "deferred": 2, "dropped": 0}
+
+
+def test_enricher_bounds_pending_lookups():
+    release = threading.Event()
+    cache = GeoCache(lambda ip: release.wait(5) and {"ip": ip})
+    enricher = GeoEnricher(cache, workers=1, max_pending=2)
+    for i in range(5):
+        assert enricher.resolve(f"10.0.0.{i}") == {"ip": f"10.0.0.{i}"}
+    assert enricher.stats()["dropped"] == 3
+    release.set()
+    enricher.close()
+
+
+def test_fill_geo_completes_rows_logged_with_only_an_ip():
+    cache = GeoCache(lambda ip: {"ip": ip})
+    cache.put("1.1.1.1", {"ip": "1.1.1.1", "city": "C", "latitude": "12.5"})
+    df = decode_events(pd.DataFrame({
+        "user": ["a", "b", "c", "d"],
+        "extra": ['{"ip": "1.1.1.1"}', '{"ip": "9.9.9.9"}', '{"ip": "1.1.1.1", "city": "Own"}', "{}"],
+    }))
+    df = fill_geo(df, cache.peek)
+    assert df["geo_city"].tolist() == ["C", None, "Own", None]
+    assert df["geo_latitude"].iloc[0] == 12.5
+
+
+RANGES = """network,start_ip,end_ip,city,country_code,latitude
+10.0.0.0/24,,,Net,IN,12.5
+,3232235520,3232235775,Int,US,
+,2001:db8::,2001:db8::ffff,Six,DE,
+"""
+
+
+def write_ranges(tmp_path, text=RANGES):
+    path = tmp_path / "ranges.csv"
+    path.write_text(text)
+    return str(path)
+
+
+def test_range_resolver_covers_cidr_integer_and_ipv6_rows(tmp_path):
+    resolver = RangeGeoResolver.from_csv(write_ranges(tmp_path))
+    assert len(resolver) == 3
+    assert resolver.resolve("10.0.0.7") == {"ip": "10.0.0.7", "city": "Net", "country_code": "IN", "latitude": 12.5}
+    assert resolver.resolve("192.168.0.255")["city"] == "Int"  # 3232235520 is 192.168.0.0
+    assert resolver.resolve("2001:db8::42")["city"] == "Six"
+    # a v4-mapped v6 address is the same key as the v4 one
+    assert resolver.resolve("::ffff:10.0.0.1")["city"] == "Net"
+    assert resolver.resolve("10.0.1.0") is None
+    assert resolver.resolve("not an ip") is None
+
+
+def test_lookup_without_fallback_raises_on_a_miss(tmp_path):
+    lookup = make_lookup(RangeGeoResolver.from_csv(write_ranges(tmp_path)), fallback=None)
+    assert lookup("10.0.0.1")["city"] == "Net"
+    with pytest.raises(LookupError):
+        lookup("8.8.8.8")
+    assert make_lookup(fallback=lambda ip: {"ip": ip, "city": "Web"})("8.8.8.8")["city"] == "Web"
+
+
+def test_newer_csv_is_rebuilt(tmp_path):
+    path = write_ranges(tmp_path)
+    assert RangeGeoResolver.from_csv(path).resolve("10.0.0.1")["city"] == "Net"
+    write_ranges(tmp_path, "network,city\n10.0.0.0/24,Moved\n")
+    later = time.time() + 10
+    os.utime(path, (later, later))
+    assert RangeGeoResolver.from_csv(path).resolve("10.0.0.1")["city"] == "Moved"
+
+
+def test_lookup_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEO_RANGES_CSV", write_ranges(tmp_path))
+    monkeypatch.setenv("GEO_HTTP_FALLBACK", "0")
+    lookup = lookup_from_env()
+    assert lookup("2001:db8::1")["city"] == "Six"
+    with pytest.raises(LookupError):
+        lookup("8.8.8.8")
+    assert os.path.exists(tmp_path / "ranges_ranges" / "starts.npy")
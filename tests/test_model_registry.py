@@ -0,0 +1,45 @@
+import numpy as np
+
+from model_registry import ModelRegistry, SharedModelCache
+
+
+def test_publish_load_and_prune(tmp_path):
+    registry = ModelRegistry(str(tmp_path), keep=2)
+    assert registry.current("m") is None
+    for i in range(3):
+        registry.publish("m", {"w": np.full(2, i)}, metadata={"note": i})
+
+    assert registry.current("m") == 3
+    assert registry.versions("m") == [2, 3]
+    artifact, meta = registry.load("m")
+    assert artifact["w"].tolist() == [2, 2]
+    assert meta["note"] == 2 and meta["format"] == "npz"
+    assert registry.load("m", 2)[0]["w"].tolist() == [1, 1]
+
+
+def test_cache_sees_versions_published_elsewhere(tmp_path):
+    cache = SharedModelCache(ModelRegistry(str(tmp_path)), check_interval=0)
+    assert cache.get("m") is None
+    # e.g. another process publishing into the same directory
+    ModelRegistry(str(tmp_path)).publish("m", {"w": np.ones(1)})
+    assert cache.get("m")["w"].tolist() == [1.0]
+    assert cache.loads == 1
+    cache.get("m")
+    assert cache.loads == 1
+
+
+def test_get_or_train_retrains_only_on_a_new_fingerprint(tmp_path):
+    cache = SharedModelCache(ModelRegistry(str(tmp_path)), decode={"m": lambda a: int(a["n"][0])})
+    calls = []
+
+    def train():
+        calls.append(1)
+        return {"n": np.array([len(calls)])}
+
+    assert cache.get_or_train("m", 10, train) == 1
+    assert cache.get_or_train("m", 10, train) == 1
+    assert cache.get_or_train("m", 12, train) == 2
+    assert len(calls) == 2
+
+    # training that yields nothing keeps the published model
+    assert cache.get_or_train("m", 13, lambda: None) == 2
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from recommendations import RecommendationTable, TableRefresher
+
+
+def views(pairs):
+    return pd.DataFrame({"user": [u for u, _ in pairs], "product_name": [p for _, p in pairs]})
+
+
+EVENTS = views([
+    ("alice", "Phone"), ("alice", "Phone"), ("alice", "Watch"),
+    ("bob", "Laptop"), ("bob", "Watch"),
+    ("guest", "Laptop"), ("guest", "Laptop"), ("guest", "Laptop"),
+    ("carol", None),
+])
+
+
+def test_from_views_ranks_own_views_then_popular():
+    table = RecommendationTable.from_views(EVENTS, topn=3)
+    # guests count towards popularity but get no list of their own
+    assert table.popular == ("Laptop", "Phone", "Watch")
+    assert table.by_user == {
+        "alice": ("Phone", "Watch", "Laptop"),
+        # tied on bob's own views, the more popular product goes first
+        "bob": ("Laptop", "Watch", "Phone"),
+    }
+    assert table.lookup("alice", topn=1) == ["Phone"]
+    assert table.lookup("guest") == table.lookup("nobody") == table.lookup(None) == ["Laptop", "Phone", "Watch"]
+
+
+def test_from_views_with_a_count_column():
+    counts = pd.DataFrame({"user": ["a", "a", "b"], "product_name": ["X", "Y", "Y"], "count": [5, 1, 2]})
+    table = RecommendationTable.from_views(counts, topn=2, count="count")
+    assert table.popular == ("X", "Y")
+    assert table.lookup("a") == ["X", "Y"]
+    assert table.lookup("b") == ["Y", "X"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "recs.json")
+    table = RecommendationTable.from_views(EVENTS, topn=2)
+    table.save(path)
+    loaded = RecommendationTable.load(path)
+    assert loaded.by_user == table.by_user
+    assert loaded.popular == table.popular
+    assert loaded.built_at == table.built_at
+
+    (tmp_path / "broken.json").write_text("{not json")
+    assert len(RecommendationTable.load(str(tmp_path / "broken.json"))) == 0
+    assert RecommendationTable.load(str(tmp_path / "missing.json")).lookup("alice") == []
+
+
+def test_refresher_serves_saved_table_then_swaps_in_rebuilds(tmp_path):
+    path = str(tmp_path / "recs.json")
+    RecommendationTable({"alice": ("Old",)}, ("Old",)).save(path)
+    release = threading.Event()
+
+    def build():
+        release.wait(5)
+        return RecommendationTable({"alice": ("New",)}, ("New",))
+
+    refresher = TableRefresher(build, path=path, interval=3600)
+    assert refresher.lookup("alice") == ["Old"]  # not cold while the first build runs
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while refresher.builds == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert refresher.lookup("alice") == ["New"]
+    assert RecommendationTable.load(path).lookup("alice") == ["New"]
+
+    refresher.build = lambda: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        refresher.refresh()
+    assert refresher.lookup("alice") == ["New"]
+    assert refresher.stats()["builds"] == 1
+    refresher.stop()
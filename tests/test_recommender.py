@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from recommender import CSRMatrix, OnlineRecommender, Vocabulary, _softmax, train_softmax
+
+
+def random_csr(rng, shape, density=0.3):
+    dense = rng.random(shape) * (rng.random(shape) < density)
+    dense[1] = 0  # keep an empty row
+    rows, cols = np.nonzero(dense)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=shape[0]))])
+    return CSRMatrix(dense[rows, cols], cols, indptr, shape), dense
+
+
+def test_csr_products_match_dense():
+    rng = np.random.default_rng(0)
+    X, dense = random_csr(rng, (6, 5))
+    w = rng.random((5, 3))
+    v = rng.random((6, 2))
+    assert np.allclose(X.toarray(), dense)
+    assert np.allclose(X.dot(w), dense @ w)
+    assert np.allclose(X.dot(w[:, 0]), dense @ w[:, 0])
+    assert np.allclose(X.tdot(v), dense.T @ v)
+
+
+def test_csr_take_rows_and_resize():
+    rng = np.random.default_rng(1)
+    X, dense = random_csr(rng, (6, 5))
+    assert np.allclose(X.take_rows([4, 1, 0, 4]).toarray(), dense[[4, 1, 0, 4]])
+    assert np.allclose(X.resize(3).toarray(), dense[:, :3])
+    assert X.resize(8).shape == (6, 8)
+
+
+def test_vocabulary_counts_and_keeps_columns():
+    vocab = Vocabulary()
+    X = vocab.encode(["a b a", "", "b c"])
+    assert vocab.words() == ["a", "b", "c"]
+    assert X.toarray().tolist() == [[2, 1, 0], [0, 0, 0], [0, 1, 1]]
+    assert vocab.encode(["c d"], grow=False).toarray().tolist() == [[0, 0, 1]]
+    vocab.encode(["d"])
+    assert vocab.index == {"a": 0, "b": 1, "c": 2, "d": 3}
+
+
+def test_softmax_is_stable_for_large_logits():
+    p = _softmax(np.array([[1000.0, 1000.0, -1000.0]]))
+    assert np.allclose(p, [[0.5, 0.5, 0.0]])
+
+
+def test_train_softmax_learns_separable_labels():
+    vocab = Vocabulary()
+    texts = ["alice laptop", "bob phone", "alice laptop", "bob phone"] * 5
+    y = [0, 1, 0, 1] * 5
+    X = vocab.encode(texts)
+    W, b, info = train_softmax(X, y, 2, max_epochs=200)
+    pred = _softmax(X.dot(W) + b).argmax(axis=1)
+    assert pred.tolist() == y
+    assert info["loss"] < 0.2
+
+    # a warm start from the trained weights stops almost immediately
+    _, _, warm = train_softmax(X, y, 2, W=W, b=b, max_epochs=200)
+    assert warm["epochs"] < info["epochs"]
+
+
+def views(pairs):
+    return pd.DataFrame({
+        "user": [u for u, _ in pairs],
+        "product_name": [p for _, p in pairs],
+        "action": "view",
+    })
+
+
+def top_pick(model, user):
+    W, b, vocab, classes = model.snapshot()
+    scores = vocab.encode([user], grow=False).resize(W.shape[0]).dot(W)[0] + b
+    return classes[int(np.argmax(scores))]
+
+
+def preferences(n=400):
+    return views([(f"user{i % 8}", f"P{i % 8 % 4}") for i in range(n)])
+
+
+def test_small_update_keeps_existing_rankings(tmp_path):
+    model = OnlineRecommender(str(tmp_path))
+    model.apply(preferences(), reset=True)
+    model.train_pending()
+    assert [top_pick(model, f"user{i}") for i in range(4)] == ["P0", "P1", "P2", "P3"]
+
+    model.apply(views([("newcomer", "P3")] * 5))
+    assert model.train_pending() == 5
+    assert [top_pick(model, f"user{i}") for i in range(4)] == ["P0", "P1", "P2", "P3"]
+    assert top_pick(model, "newcomer") == "P3"
+
+
+def test_restart_resumes_training_state(tmp_path):
+    model = OnlineRecommender(str(tmp_path))
+    model.apply(preferences(), reset=True)
+    model.train_pending()
+
+    restarted = OnlineRecommender(str(tmp_path))
+    assert np.array_equal(restarted.W, model.W)
+    assert np.array_equal(restarted.hW, model.hW)
+    # replaying the store only buffers rows past the persisted mark
+    restarted.apply(pd.concat([preferences(), views([("newcomer", "P3")] * 5)], ignore_index=True), reset=True)
+    assert restarted.train_pending() == 5
+    assert [top_pick(restarted, f"user{i}") for i in range(4)] == ["P0", "P1", "P2", "P3"]
+    assert restarted.views_trained == 405
@@ -0,0 +1,67 @@
+import datetime
+
+import pandas as pd
+
+from rollups import EventRollup, count_by
+
+ACTIONS = ["view", "view", "add_to_cart", "purchase"]
+
+
+def events(n, start=0):
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime("2024-01-01") + pd.to_timedelta([(start + i) * 20 for i in range(n)], unit="min"),
+        "action": [ACTIONS[(start + i) % 4] for i in range(n)],
+        "product_name": [f"P{(start + i) % 3}" for i in range(n)],
+        "user": [f"u{(start + i) % 2}" for i in range(n)],
+        "geo_country_name": ["India" if (start + i) % 5 else None for i in range(n)],
+        "geo_city": [None] * n,
+        "geo_latitude": [None] * n,
+        "geo_longitude": [None] * n,
+    }, index=range(start, start + n))
+
+
+def sorted_cube(rollup):
+    cols = ["hour", "action", "product_name", "user", "geo_country_name"]
+    return rollup.cube().sort_values(cols, na_position="first").reset_index(drop=True)
+
+
+def test_incremental_updates_match_a_full_rebuild():
+    full = EventRollup()
+    full.update(events(200))
+
+    incremental = EventRollup()
+    incremental.apply(events(13), reset=True)
+    for start in range(13, 200, 37):
+        incremental.apply(events(min(37, 200 - start), start))
+
+    assert incremental.events == full.events == 200
+    pd.testing.assert_frame_equal(sorted_cube(incremental), sorted_cube(full))
+    assert sorted_cube(full)["count"].sum() == 200
+
+    incremental.apply(events(5), reset=True)
+    assert incremental.events == 5
+
+
+def test_slice_applies_every_filter():
+    rollup = EventRollup()
+    rollup.update(events(200))
+    day = datetime.date(2024, 1, 2)
+
+    assert rollup.slice()["count"].sum() == 200
+    assert rollup.slice(actions=["purchase"])["count"].sum() == 50
+    assert set(rollup.slice(products=["P1"])["product_name"]) == {"P1"}
+    assert set(rollup.slice(users=["u0"])["user"]) == {"u0"}
+    # 72 events a day at 20 minute spacing; end_date includes the whole day
+    assert rollup.slice(start_date=day, end_date=day)["count"].sum() == 72
+    assert rollup.slice(actions=["view"], users=["u1"], end_date=datetime.date(2024, 1, 1))["count"].sum() == 18
+
+
+def test_count_by_sums_and_orders_counts():
+    rollup = EventRollup()
+    rollup.update(events(200))
+    by_action = count_by(rollup.cube(), "action", name="events")
+    assert by_action.columns.tolist() == ["action", "events"]
+    assert by_action["events"].tolist() == [100, 50, 50]
+    assert by_action["action"].iloc[0] == "view"
+    # rows without a country are left out rather than counted under NaN
+    assert count_by(rollup.cube(), "geo_country_name")["count"].tolist() == [160]
@@ -0,0 +1,69 @@
+import pytest
+
+from search_index import SearchIndex, tokenize
+
+DOCS = [
+    (1, "Laptop Computers"),
+    (2, "iPhone 16 Phones"),
+    (3, "Keyboard Accessories"),
+    (4, "Gaming Laptop Computers"),
+    (5, "Laptop Sleeve Accessories"),
+]
+
+
+def make_index():
+    return SearchIndex.build(DOCS)
+
+
+def test_tokenize():
+    assert tokenize("iPhone 16, Pro-Max") == ["iphone", "16", "pro", "max"]
+    assert tokenize("") == []
+
+
+def test_prefix_matches_whole_terms():
+    index = make_index()
+    assert sorted(index.search("lap")) == [1, 4, 5]
+    assert index.search("phon") == [2]
+    assert index.search("aptop") == []
+
+
+def test_every_token_must_match():
+    index = make_index()
+    assert sorted(index.search("lap acc")) == [5]
+    assert index.search("laptop phones") == []
+    assert index.search("lap nothing") == []
+
+
+def test_empty_query_matches_nothing():
+    assert make_index().search("  ") == []
+
+
+def test_shorter_document_ranks_first():
+    index = make_index()
+    # same term frequency, so BM25's length normalisation decides
+    assert index.search("laptop") == [1, 4, 5]
+
+
+def test_limit_keeps_best_results():
+    index = make_index()
+    assert index.search("lap", limit=2) == index.search("lap")[:2]
+
+
+def test_expansions_are_capped_to_the_most_common_terms():
+    index = SearchIndex.build(
+        [(i, f"ab{i}") for i in range(10)] + [(10 + i, "abz") for i in range(3)],
+        max_expansions=2,
+    )
+    terms = index.expand("ab")
+    assert len(terms) == 2 and terms[0] == "abz"
+
+
+def test_add_indexes_in_place_and_refreshes_prefixes():
+    index = make_index()
+    assert index.search("lapd") == []
+    index.add(6, "Lapdesk Accessories")
+    assert index.search("lapd") == [6]
+    assert 6 in index.search("lap")
+    assert index.stats()["products"] == 6
+    with pytest.raises(ValueError):
+        index.add(6, "again")